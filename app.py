@@ -1,29 +1,409 @@
-from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_template
+from flask import Flask, request, jsonify, render_template, send_from_directory, Response, stream_template, g
 from flask_cors import CORS
+import hashlib
+import hmac
+import importlib.util
 import logging
-import json
+import os
 import time
-from backend.config import Config, MODE_PROMPTS
-from backend.services.ollama_service import OllamaService
+from functools import wraps
+from typing import Optional
+from werkzeug.exceptions import RequestEntityTooLarge
+from backend.config import Config, MODE_PROMPTS, snapshot as config_snapshot
+from backend import profiling, serialization, tracing
+from backend.compression import DYNAMIC_LEVELS, SUPPORTED_ENCODINGS, choose_encoding, compress
+from backend.serialization import FastJSONProvider, SSEFrames, sse_event
+from backend.startup import Deferred, LazyProxy, ReadinessProbe
+from backend.static_assets import Asset, StaticAssets
+from backend.services.cancellation import ActiveRequests, CancelToken, Cancelled
+from backend.services.metrics import build_metrics
+from backend.services.rate_limiter import RateLimiter, load_backend
+from backend.services.scheduler import FairScheduler, SchedulerTimeout
+from backend.services.traffic_capture import build_capture
+from backend.services.ws_multiplexer import MultiplexedConnection, StreamRejected
+
+# WebSocket support is optional (pip install flask-sock). flask_sock pulls in
+# simple_websocket and asyncio, so it is imported when the /ws handler is built
+websocket_available = importlib.util.find_spec('flask_sock') is not None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__, static_folder='frontend', template_folder='frontend')
-CORS(app)  # Enable CORS for frontend integration
+app.json = FastJSONProvider(app)  # orjson-backed jsonify() when installed
+CORS(app, expose_headers=['ETag', 'X-Request-ID'])  # Enable CORS for frontend integration
+# Werkzeug rejects larger bodies from Content-Length and caps streamed reads
+app.config['MAX_CONTENT_LENGTH'] = Config.MAX_REQUEST_BYTES
+
+# Counters are aggregated across workers in prefork mode
+metrics = build_metrics()
+
+
+def _build_ollama_service():
+    # Imported here so lazy startup does not load requests and the explanation store up front
+    from backend.services.ollama_service import OllamaService
+    return OllamaService(metrics=metrics)
+
+
+def _build_static_assets():
+    return StaticAssets(os.path.join(app.root_path, 'frontend'))
+
+
+# Ollama service (once per process) and frontend assets (hashed and precompressed
+# once, then served from memory); built at import, on first use or in the background
+ollama_deferred = Deferred('ollama_service', _build_ollama_service)
+static_deferred = Deferred('static_assets', _build_static_assets) if Config.STATIC_PIPELINE else None
+if Config.STARTUP_MODE == 'eager':
+    ollama_service = ollama_deferred.get()
+    static_assets = static_deferred.get() if static_deferred else None
+else:
+    ollama_service = LazyProxy(ollama_deferred)
+    static_assets = LazyProxy(static_deferred) if static_deferred else None
+
+# /ready answers from a background probe instead of calling Ollama per request
+readiness = ReadinessProbe(lambda: ollama_service.is_available(), interval=Config.READINESS_INTERVAL)
+if Config.STARTUP_MODE == 'background':
+    ollama_deferred.start()
+    if static_deferred:
+        static_deferred.start()
+    readiness.start()
+
+# Sampled request spans, exported to a file or a local OTLP collector
+tracer = tracing.get_tracer()
+
+# tracemalloc control and per-endpoint allocation accounting (/admin/profile/memory)
+allocation_tracker = profiling.AllocationTracker()
+
+# Anonymized explain requests for replay (None unless CAPTURE_ENABLED)
+traffic_capture = build_capture()
+
+# Per-client quotas and fair sharing of the (usually single) model;
+# prefork workers share their buckets unless a backend is configured explicitly
+rate_limit_backend = Config.RATE_LIMIT_BACKEND
+if Config.DEPLOYMENT_MODE == 'prefork' and rate_limit_backend == 'memory':
+    rate_limit_backend = 'shared'
+rate_limiter = RateLimiter(
+    Config.RATE_LIMIT_PER_MINUTE,
+    Config.RATE_LIMIT_BURST,
+    backend=load_backend(rate_limit_backend),
+    idle_ttl=Config.CLIENT_IDLE_TTL
+)
+scheduler = FairScheduler(Config.GENERATION_SLOTS, Config.SCHEDULER_QUANTUM)
+
+# In-flight generations by request id, for DELETE /explain/<id> and REQUEST_DEADLINE
+active_requests = ActiveRequests()
+
+
+def get_client_id() -> str:
+    """
+    Identify the caller by API key if it is one of API_KEYS, otherwise by remote address
+
+    Unknown keys are ignored: a fresh key per request would otherwise get a
+    fresh quota and scheduler share. Keys are hashed so /usage never echoes them.
+    """
+    api_key = request.headers.get('X-API-Key')
+    if api_key and api_key in Config.API_KEYS:
+        return f"key:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:16]}"
+    return f"ip:{request.remote_addr or 'unknown'}"
+
+
+def rate_limited_response(retry_after: float):
+    """429 response with a Retry-After hint"""
+    response = jsonify({"error": "Rate limit exceeded. Please slow down."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+    return response
+
+ALLOWED_MODES = set(MODE_PROMPTS.keys()) | {"senior"}
+
+# Fixed SSE frames are encoded once instead of on every stream
+sse_frames = SSEFrames(ALLOWED_MODES, Config.MODEL_NAME)
+
+
+def _build_modes_body() -> Asset:
+    return Asset('modes.json', serialization.dumps_bytes({
+        "modes": sorted(ALLOWED_MODES),
+        "descriptions": {
+            "friend": "Casual, friendly explanations",
+            "professor": "Academic, detailed explanations",
+            "senior": "Critical, blunt feedback (alias of 'review')",
+            "babysitter": "Beginner-friendly, simple explanations",
+            "review": "Strict code review with actionable improvements"
+        }
+    }))
+
+
+def _build_config_body() -> Asset:
+    settings = config_snapshot()
+    return Asset('config.json', serialization.dumps_bytes({
+        "model": settings['MODEL_NAME'],
+        "ollama_host": settings['OLLAMA_HOST'],
+        "ollama_port": settings['OLLAMA_PORT'],
+        "keep_alive": settings['KEEP_ALIVE'],
+        "use_fallback_first": settings['USE_FALLBACK_FIRST'],
+        "max_tokens": settings['MAX_TOKENS'],
+        "adaptive_tokens": settings['ADAPTIVE_TOKENS'],
+        "temperature": settings['TEMPERATURE'],
+        "top_p": settings['TOP_P'],
+        "startup_mode": settings['STARTUP_MODE']
+    }))
+
+
+# /modes and /config never change while the process runs: their bodies are
+# serialized and compressed once on first request and served with strong ETags
+modes_body = Deferred('modes_body', _build_modes_body)
+config_body = Deferred('config_body', _build_config_body)
+
+
+def _read_body() -> bytes:
+    """
+    Read the raw body under the MAX_REQUEST_BYTES cap
+
+    Chunked uploads have no Content-Length; Werkzeug stops reading at the
+    cap, so a body that fills it completely is treated as oversized.
+    """
+    raw = request.get_data(cache=False)
+    if request.content_length is None and len(raw) >= Config.MAX_REQUEST_BYTES:
+        raise RequestEntityTooLarge()
+    return raw
+
+
+def _read_code_upload():
+    """
+    Read code and mode from the request body
+
+    Accepts JSON ({"code", "mode"}), raw text/plain (mode in the query
+    string) or multipart/form-data (a 'code' field or file). Returns
+    (code, mode, error_message).
+    """
+    content_type = request.mimetype
+    if request.is_json:
+        try:
+            data = serialization.loads(_read_body())
+        except serialization.DecodeError:
+            return None, None, "Invalid JSON body"
+        if not isinstance(data, dict) or 'code' not in data or 'mode' not in data:
+            return None, None, "Missing required fields: 'code' and 'mode'"
+        return data.get('code'), data.get('mode'), None
+    if content_type == 'text/plain':
+        raw = _read_body()
+        try:
+            return raw.decode(request.mimetype_params.get('charset', 'utf-8')), request.args.get('mode'), None
+        except (UnicodeDecodeError, LookupError):
+            return None, None, "Code must be valid UTF-8 text"
+    if content_type == 'multipart/form-data':
+        mode = request.form.get('mode') or request.args.get('mode')
+        upload = request.files.get('code') or request.files.get('file')
+        if upload is not None:
+            try:
+                return upload.read().decode('utf-8'), mode, None
+            except UnicodeDecodeError:
+                return None, None, "Code must be valid UTF-8 text"
+        return request.form.get('code'), mode, None
+    return None, None, "Request must be JSON, text/plain or multipart/form-data"
+
+
+def parse_explain_request():
+    """
+    Validate an explain request before doing any work
+
+    Oversized bodies are refused from Content-Length alone, before anything
+    is read or decoded. Returns (code, mode, error_response).
+    """
+    if request.content_length is not None and request.content_length > Config.MAX_REQUEST_BYTES:
+        return None, None, (jsonify({"error": f"Request too large. Maximum size: {Config.MAX_REQUEST_BYTES} bytes"}), 413)
+
+    code, mode, message = _read_code_upload()
+    if not message:
+        code, mode, message = validate_explain_input(code, mode)
+    if message:
+        return None, None, (jsonify({"error": message}), 400)
+    return code, mode, None
+
+
+def validate_explain_input(code, mode):
+    """Normalize and check code/mode from any transport; returns (code, mode, error_message)"""
+    if code is None or mode is None:
+        return None, None, "Missing required fields: 'code' and 'mode'"
+
+    code = str(code).strip()
+    mode = str(mode).lower()
+
+    if not code:
+        return None, None, "Code cannot be empty"
+
+    if len(code) > Config.MAX_CODE_LENGTH:
+        return None, None, f"Code too long. Maximum length: {Config.MAX_CODE_LENGTH} characters"
+
+    if mode not in ALLOWED_MODES:
+        return None, None, f"Invalid mode. Supported modes: {sorted(list(ALLOWED_MODES))}"
+
+    return code, mode, None
+
+
+def generate_chunks(code: str, mode: str, client_id: str, cancel: Optional[CancelToken] = None):
+    """
+    Yield streaming chunks for one explanation
+
+    Precomputed and cached answers are streamed directly; real generations
+    first wait for this client's fair share of a generation slot. Raises
+    SchedulerTimeout if no slot frees up in time, or Cancelled if ``cancel``
+    fires while waiting.
+    """
+    cached = ollama_service.lookup_cached(code, mode)
+    if cached is not None:
+        yield from ollama_service.stream_result(cached)
+        return
+    chunks = ollama_service.get_explanation_stream(code, mode, cancel=cancel, use_cache=False)
+    with scheduler.slot(client_id, timeout=Config.QUEUE_TIMEOUT, cancel=cancel):
+        started = time.time()
+        try:
+            # no artificial delay; stream as fast as available
+            yield from chunks
+        finally:
+            chunks.close()
+            rate_limiter.record(client_id, 'generation_seconds', time.time() - started)
+    rate_limiter.record(client_id, 'generations')
+
+
+@app.before_request
+def start_request_span():
+    """Root span for the request, continuing the caller's traceparent if sent"""
+    if request.endpoint in ('index', 'static_files', 'static'):
+        return
+    route = request.url_rule.rule if request.url_rule else request.path
+    g.trace_span = tracer.start_trace(
+        f"{request.method} {route}",
+        traceparent=request.headers.get('traceparent'),
+        request_id=tracing.request_id_from(request.headers.get('X-Request-ID')),
+        attributes={"http.method": request.method, "http.route": route}
+    )
+    g.trace_token = tracing.attach(g.trace_span)
+    g.alloc_start = allocation_tracker.begin_request()
+
+
+@app.after_request
+def finish_request_span(response):
+    span = g.get('trace_span')
+    if span is None:
+        return response
+    response.headers['X-Request-ID'] = span.request_id
+    span.set_attribute("http.status_code", response.status_code)
+    endpoint, alloc_start = request.endpoint, g.get('alloc_start')
+    if response.is_streamed:
+        # Streamed bodies are written after the request context is gone; end when the body is done
+        g.trace_deferred = True
+        response.call_on_close(span.end)
+        response.call_on_close(lambda: allocation_tracker.end_request(endpoint, alloc_start))
+    else:
+        allocation_tracker.end_request(endpoint, alloc_start)
+    return response
+
+
+@app.after_request
+def record_captured_request(response):
+    """Finish the capture entry of a non-streamed explain response (streams record their own)"""
+    entry = g.get('capture')
+    if entry is not None and not response.is_streamed:
+        entry.update(
+            status=response.status_code,
+            duration_ms=round((time.time() - entry["ts"]) * 1000, 1),
+            response_bytes=response.calculate_content_length()
+        )
+        traffic_capture.record(entry)
+    return response
+
+
+@app.after_request
+def compress_response(response):
+    """Negotiated gzip/brotli for non-streamed JSON bodies of at least COMPRESS_MIN_BYTES"""
+    if (not Config.RESPONSE_COMPRESSION or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if len(body) < Config.COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings, SUPPORTED_ENCODINGS)
+    if encoding is not None:
+        response.set_data(compress(body, encoding, DYNAMIC_LEVELS[encoding]))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def explanation_etag(code: str, mode: str) -> str:
+    """
+    Validator for an /explain answer: its explanation cache key plus the requested mode
+
+    Used as a weak ETag, since an answer generated again is equivalent but not byte-identical.
+    """
+    key = "|".join(ollama_service.store_key(code, mode) + (mode,))
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def cancelled_response(reason: str):
+    """504 when the request ran past REQUEST_DEADLINE, 409 when its client cancelled it"""
+    if reason == 'deadline':
+        return jsonify({"error": "Request deadline exceeded", "cancelled": reason}), 504
+    return jsonify({"error": "Request cancelled", "cancelled": reason}), 409
+
+
+def cache_outcome(result) -> str:
+    """How an explanation (a result or a stream's 'done' event) was obtained, for capture entries"""
+    if result.get("precomputed"):
+        return "precomputed"
+    return "hit" if result.get("cached") else "miss"
+
+
+@app.teardown_request
+def end_request_span(exc):
+    span = g.get('trace_span')
+    if span is None:
+        return
+    tracing.detach(g.trace_token)
+    if exc is not None:
+        span.set_error(f"{type(exc).__name__}: {exc}")
+    if not g.get('trace_deferred'):
+        span.end()
+
+
+def admin_required(view):
+    """Only callers presenting ADMIN_TOKEN (Bearer or X-Admin-Token); 404 when no token is configured"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not Config.ADMIN_TOKEN:
+            return jsonify({"error": "Not found"}), 404
+        supplied = request.headers.get('X-Admin-Token', '')
+        auth = request.headers.get('Authorization', '')
+        if auth.startswith('Bearer '):
+            supplied = auth[7:]
+        if not hmac.compare_digest(supplied.encode('utf-8'), Config.ADMIN_TOKEN.encode('utf-8')):
+            return jsonify({"error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@app.errorhandler(RequestEntityTooLarge)
+def request_too_large(e):
+    """Bodies over MAX_REQUEST_BYTES are cut off while streaming in"""
+    return jsonify({"error": f"Request too large. Maximum size: {Config.MAX_REQUEST_BYTES} bytes"}), 413
 
-# Initialize Ollama service once per process
-ollama_service = OllamaService()
 
 @app.route('/')
 def index():
     """Serve the main frontend page"""
+    if static_assets:
+        return static_assets.serve('index.html') or send_from_directory('frontend', 'index.html')
     return send_from_directory('frontend', 'index.html')
 
 @app.route('/<path:filename>')
 def static_files(filename):
     """Serve static files (CSS, JS, etc.)"""
+    if static_assets:
+        response = static_assets.serve(filename)
+        if response is not None:
+            return response
     return send_from_directory('frontend', filename)
 
 @app.route('/health', methods=['GET'])
@@ -31,6 +411,19 @@ def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "Code Whisper backend is running"})
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness: the service is initialized and Ollama answered the last background probe"""
+    readiness.start()
+    status = readiness.status()
+    ready = status["ready"] and ollama_deferred.ready
+    return jsonify(dict(
+        status,
+        ready=ready,
+        startup_mode=Config.STARTUP_MODE,
+        service=ollama_deferred.state()
+    )), 200 if ready else 503
+
 @app.route('/explain', methods=['POST'])
 def explain_code():
     """
@@ -41,55 +434,81 @@ def explain_code():
         "code": "your code here",
         "mode": "friend|professor|senior|babysitter"
     }
+    
+    Large snippets may instead be posted as text/plain (?mode=...) or
+    multipart/form-data to skip JSON escaping.
     """
+    with tracer.span("parse_request"):
+        code, mode, error = parse_explain_request()
+    if error:
+        return error
+
     try:
-        # Validate request
-        if not request.is_json:
-            return jsonify({"error": "Request must be JSON"}), 400
-        
-        data = request.get_json()
-        
-        # Validate required fields
-        if 'code' not in data or 'mode' not in data:
-            return jsonify({"error": "Missing required fields: 'code' and 'mode'"}), 400
-        
-        code = data['code'].strip()
-        mode = data['mode'].lower()
-        
-        # Validate inputs
-        if not code:
-            return jsonify({"error": "Code cannot be empty"}), 400
-        
-        if len(code) > Config.MAX_CODE_LENGTH:
-            return jsonify({"error": f"Code too long. Maximum length: {Config.MAX_CODE_LENGTH} characters"}), 400
-        
-        allowed_modes = set(MODE_PROMPTS.keys()) | {"senior"}
-        if mode not in allowed_modes:
-            return jsonify({
-                "error": f"Invalid mode. Supported modes: {sorted(list(allowed_modes))}"
-            }), 400
-        
-        # Check if Ollama is available
-        if not ollama_service.is_available():
-            return jsonify({
-                "error": "AI service is not available. Please make sure Ollama is running with the configured model."
-            }), 503
+        client_id = get_client_id()
+        if traffic_capture is not None:
+            g.capture = traffic_capture.request_fields('explain', code, mode, client_id)
+
+        # Clients holding this answer revalidate without it being generated or sent again
+        etag = explanation_etag(code, mode)
+        if request.if_none_match.contains_weak(etag):
+            metrics.incr('not_modified')
+            if g.get('capture') is not None:
+                g.capture.update(cache="revalidated")
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            return response
+
+        with tracer.span("rate_limit"):
+            allowed, retry_after = rate_limiter.check(client_id)
+        if not allowed:
+            return rate_limited_response(retry_after)
         
-        # Send request to Ollama
-        logger.info(f"Sending request to Ollama with mode: {mode}")
-        result = ollama_service.get_explanation(code, mode)
+        # Popular and repeated snippets are answered without touching Ollama
+        result = ollama_service.lookup_cached(code, mode)
+        if result is None:
+            # Check if Ollama is available
+            if not ollama_service.is_available():
+                return jsonify({
+                    "error": "AI service is not available. Please make sure Ollama is running with the configured model."
+                }), 503
+            
+            # Send request to Ollama once this client's fair share allows it; until the
+            # answer is back it can be cancelled by request id or by its deadline
+            logger.info(f"Sending request to Ollama with mode: {mode}")
+            request_id = g.trace_span.request_id
+            cancel = active_requests.track(request_id, client_id, deadline=Config.REQUEST_DEADLINE)
+            try:
+                with scheduler.slot(client_id, timeout=Config.QUEUE_TIMEOUT, cancel=cancel):
+                    started = time.time()
+                    result = ollama_service.get_explanation(code, mode, use_cache=False, cancel=cancel)
+                    rate_limiter.record(client_id, 'generation_seconds', time.time() - started)
+            except SchedulerTimeout:
+                return jsonify({"error": "Server is busy. Please try again shortly."}), 503
+            except Cancelled:
+                return cancelled_response(cancel.reason)
+            finally:
+                active_requests.release(request_id, client_id, cancel)
+            if result.get("cancelled"):
+                return cancelled_response(result["cancelled"])
+            rate_limiter.record(client_id, 'generations')
         
+        if g.get('capture') is not None:
+            g.capture.update(cache=cache_outcome(result), model=result.get("model"))
         if not result.get("success", False):
             return jsonify({"error": result.get("error", "Failed to get explanation from AI model")}), 500
         
         # Return successful response
-        return jsonify({
+        response = jsonify({
             "success": True,
             "mode": mode,
             "explanation": result.get("explanation"),
             "model": result.get("model", "unknown"),
             "code_length": len(code)
         })
+        # Fallback text stands in for an unavailable model, so clients must not keep it
+        if result.get("model") != "smart-fallback":
+            response.set_etag(etag, weak=True)
+        return response
         
     except Exception as e:
         logger.error(f"Error in explain_code: {str(e)}")
@@ -102,43 +521,89 @@ def explain_code_stream():
     Stream code explanation in real-time using Server-Sent Events
     """
     # Validate request BEFORE creating the generator to avoid context loss
-    if not request.is_json:
-        return jsonify({"error": "Request must be JSON"}), 400
-
-    data = request.get_json(silent=True) or {}
-
-    if 'code' not in data or 'mode' not in data:
-        return jsonify({"error": "Missing required fields"}), 400
-
-    code = (data.get('code') or '').strip()
-    mode = str(data.get('mode') or '').lower()
-
-    if not code:
-        return jsonify({"error": "Code cannot be empty"}), 400
+    with tracer.span("parse_request"):
+        code, mode, error = parse_explain_request()
+    if error:
+        return error
 
-    if len(code) > Config.MAX_CODE_LENGTH:
-        return jsonify({"error": f"Code too long. Maximum length: {Config.MAX_CODE_LENGTH} characters"}), 400
+    client_id = get_client_id()
+    if traffic_capture is not None:
+        g.capture = traffic_capture.request_fields('explain-stream', code, mode, client_id)
+    with tracer.span("rate_limit"):
+        allowed, retry_after = rate_limiter.check(client_id)
+    if not allowed:
+        return rate_limited_response(retry_after)
 
-    allowed_modes = set(MODE_PROMPTS.keys()) | {"senior"}
-    if mode not in allowed_modes:
-        return jsonify({"error": f"Invalid mode. Supported modes: {sorted(list(allowed_modes))}"}), 400
+    request_span = tracing.current_span()
+    request_id = g.trace_span.request_id
+    capture_entry = g.pop('capture', None)
 
     def generate_stream(validated_code: str, validated_mode: str):
-        try:
-            # Send start event
-            yield f"data: {json.dumps({'type': 'start', 'mode': validated_mode, 'model': Config.MODEL_NAME})}\n\n"
+        # Time suspended at a yield is time the server spends writing the frame to the client
+        span = tracer.start_span("sse.stream", parent=request_span)
+        frames = sent = write_ns = 0
+        first_chunk_at = done = None
+        outcome = "disconnected"
+        # Tracked here rather than in the view: a body that is never iterated never releases
+        cancel = active_requests.track(request_id, client_id, deadline=Config.REQUEST_DEADLINE)
+        chunks = generate_chunks(validated_code, validated_mode, client_id, cancel)
+        with span, tracing.activate(span):
+            try:
+                # Send start event
+                yield sse_frames.start[validated_mode]
 
-            # Get streaming explanation
-            for chunk in ollama_service.get_explanation_stream(validated_code, validated_mode):
-                yield f"data: {json.dumps(chunk)}\n\n"
-                # no artificial delay; stream as fast as available
+                # Get streaming explanation
+                for chunk in chunks:
+                    if first_chunk_at is None:
+                        first_chunk_at = time.time()
+                    if chunk.get("type") == "done":
+                        done = chunk
+                    frame = sse_event(chunk)
+                    started = time.perf_counter_ns()
+                    yield frame
+                    write_ns += time.perf_counter_ns() - started
+                    frames += 1
+                    sent += len(frame)
 
-            # Send completion event
-            yield f"data: {json.dumps({'type': 'complete'})}\n\n"
+                if cancel.cancelled:
+                    outcome = "cancelled"
+                    yield sse_frames.cancelled[cancel.reason]
+                else:
+                    # Send completion event
+                    outcome = "complete"
+                    yield sse_frames.complete
 
-        except Exception as e:
-            logger.error(f"Error in explain_code_stream: {str(e)}")
-            yield f"data: {json.dumps({'type': 'error', 'message': 'Internal server error'})}\n\n"
+            except GeneratorExit:
+                # The server found the client gone when writing a frame: stop generating for it
+                cancel.cancel('disconnected')
+                raise
+            except Cancelled:
+                outcome = "cancelled"
+                yield sse_frames.cancelled[cancel.reason]
+            except SchedulerTimeout:
+                outcome = "busy"
+                span.set_error("SchedulerTimeout")
+                yield sse_frames.busy
+            except Exception as e:
+                outcome = "error"
+                logger.error(f"Error in explain_code_stream: {str(e)}")
+                span.set_error(f"{type(e).__name__}: {e}")
+                yield sse_frames.internal_error
+            finally:
+                chunks.close()
+                active_requests.release(request_id, client_id, cancel)
+                span.set_attributes({"sse.frames": frames, "sse.bytes": sent, "sse.write_ms": write_ns / 1e6})
+                if capture_entry is not None:
+                    capture_entry.update(
+                        status=200,
+                        outcome=outcome,
+                        duration_ms=round((time.time() - capture_entry["ts"]) * 1000, 1),
+                        ttfb_ms=round((first_chunk_at - capture_entry["ts"]) * 1000, 1) if first_chunk_at else None,
+                        response_bytes=sent,
+                        cache=cache_outcome(done) if done else None,
+                        model=done.get("model") if done else None
+                    )
+                    traffic_capture.record(capture_entry)
 
     return Response(
         generate_stream(code, mode),
@@ -152,42 +617,253 @@ def explain_code_stream():
     )
 
 
+@app.route('/explain/<request_id>', methods=['DELETE'])
+def cancel_explanation(request_id):
+    """
+    Cancel an in-flight /explain or /explain-stream request of the calling client
+
+    The id is the request's X-Request-ID. Clients that send their own
+    X-Request-ID know it before any response arrives.
+    """
+    if not active_requests.cancel(request_id, get_client_id()):
+        return jsonify({"error": "No such request in progress"}), 404
+    return '', 204
+
+
+if websocket_available:
+    # Frames are capped like HTTP bodies, and pings drop dead peers
+    app.config['SOCK_SERVER_OPTIONS'] = {
+        'max_message_size': Config.MAX_REQUEST_BYTES,
+        'ping_interval': Config.WS_PING_INTERVAL or None
+    }
+
+    def explain_websocket(ws):
+        """
+        Multiplexed explanation streams over one WebSocket
+
+        See MultiplexedConnection for the message protocol. Each explain
+        message is validated and rate limited like a POST to /explain-stream.
+        """
+        client_id = get_client_id()
+        connection_span = tracing.current_span()
+        connection_id = g.trace_span.request_id
+
+        def open_stream(message, cancel):
+            code, mode, error = validate_explain_input(message.get('code'), message.get('mode'))
+            if error:
+                raise StreamRejected(error)
+            capture_entry = None
+            if traffic_capture is not None:
+                capture_entry = traffic_capture.request_fields('ws', code, mode, client_id)
+            allowed, _ = rate_limiter.check(client_id)
+            if not allowed:
+                if capture_entry is not None:
+                    capture_entry.update(status=429, duration_ms=0.0)
+                    traffic_capture.record(capture_entry)
+                raise StreamRejected("Rate limit exceeded. Please slow down.")
+            return stream_events(code, mode, cancel, f"{connection_id}:{message.get('id')}", capture_entry)
+
+        def stream_events(code, mode, cancel, request_id, capture_entry=None):
+            # Streams run on their own threads, so the connection span is passed explicitly
+            span = tracer.start_span("ws.stream", parent=connection_span, attributes={"explain.mode": mode})
+            active_requests.track(request_id, client_id, cancel, deadline=Config.REQUEST_DEADLINE)
+            first_chunk_at = done = None
+            sent = 0
+            outcome = "disconnected"
+            with span, tracing.activate(span):
+                try:
+                    yield {'type': 'start', 'mode': mode, 'model': Config.MODEL_NAME}
+                    for event in generate_chunks(code, mode, client_id, cancel):
+                        if first_chunk_at is None:
+                            first_chunk_at = time.time()
+                        if event.get("type") == "done":
+                            done = event
+                        if capture_entry is not None:
+                            sent += len(serialization.dumps_bytes(event))
+                        yield event
+                    if not cancel.cancelled:
+                        outcome = "complete"
+                        yield {'type': 'complete'}
+                except SchedulerTimeout:
+                    outcome = "busy"
+                    span.set_error("SchedulerTimeout")
+                    yield {'type': 'error', 'message': 'Server is busy. Please try again shortly.'}
+                except Cancelled:
+                    pass  # the connection reports the cancellation
+                except Exception:
+                    outcome = "error"
+                    raise
+                finally:
+                    active_requests.release(request_id, client_id, cancel)
+                    if cancel.cancelled:
+                        span.set_attribute("generation.cancelled", cancel.reason)
+                        outcome = "disconnected" if cancel.reason == 'disconnected' else "cancelled"
+                    if capture_entry is not None:
+                        capture_entry.update(
+                            status=200,
+                            outcome=outcome,
+                            duration_ms=round((time.time() - capture_entry["ts"]) * 1000, 1),
+                            ttfb_ms=round((first_chunk_at - capture_entry["ts"]) * 1000, 1) if first_chunk_at else None,
+                            response_bytes=sent,
+                            cache=cache_outcome(done) if done else None,
+                            model=done.get("model") if done else None
+                        )
+                        traffic_capture.record(capture_entry)
+
+        def receive():
+            try:
+                return ws.receive()
+            except ConnectionClosed:
+                return None
+
+        from simple_websocket import ConnectionClosed
+        connection = MultiplexedConnection(
+            ws.send, open_stream,
+            max_streams=Config.WS_MAX_STREAMS,
+            queue_size=Config.WS_SEND_QUEUE
+        )
+        connection.serve(receive)
+
+    def _build_websocket_view():
+        from flask_sock import Sock
+
+        class _ViewHolder:
+            # Stands in for the blueprint flask_sock registers on, keeping the view it builds
+            def route(self, path, **kwargs):
+                return lambda view: setattr(self, 'view', view)
+
+        holder = _ViewHolder()
+        Sock().route('/ws', bp=holder)(explain_websocket)
+        return holder.view
+
+    # Built with the other startup work: at import, on the first /ws request or in the background
+    websocket_deferred = Deferred('websocket', _build_websocket_view)
+    if Config.STARTUP_MODE == 'eager':
+        websocket_deferred.get()
+    elif Config.STARTUP_MODE == 'background':
+        websocket_deferred.start()
+
+    @app.route('/ws', websocket=True)
+    def websocket_endpoint():
+        return websocket_deferred.get()()
+
+
 @app.route('/modes', methods=['GET'])
 def get_available_modes():
     """Get list of available explanation modes"""
-    modes = sorted(list(set(MODE_PROMPTS.keys()) | {"senior"}))
+    return modes_body.get().response()
+
+@app.route('/usage', methods=['GET'])
+def get_usage():
+    """Usage counters for the calling client plus current scheduler load"""
+    client_id = get_client_id()
     return jsonify({
-        "modes": modes,
-        "descriptions": {
-            "friend": "Casual, friendly explanations",
-            "professor": "Academic, detailed explanations", 
-            "senior": "Critical, blunt feedback (alias of 'review')",
-            "babysitter": "Beginner-friendly, simple explanations",
-            "review": "Strict code review with actionable improvements"
-        }
+        "client": client_id,
+        "usage": rate_limiter.usage(client_id),
+        "scheduler": scheduler.stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Service counters (summed across workers in prefork mode)"""
+    return jsonify({
+        "deployment_mode": Config.DEPLOYMENT_MODE,
+        "counters": metrics.snapshot(),
+        "cache_entries": len(ollama_service.cache) if ollama_service.cache is not None else 0,
+        "scheduler": scheduler.stats(),
+        "active_requests": len(active_requests),
+        # per-process: budgets are learned by each worker from its own completions
+        "generation_budgets": ollama_service.budgets.report()
+    })
+
+@app.route('/admin/profile/cpu', methods=['GET'])
+@admin_required
+def profile_cpu():
+    """
+    Sample this worker's stacks for ?seconds= (default 10, max 60)
+
+    Returns collapsed stacks (text/plain) for flamegraph.pl or speedscope.
+    ?mode=cpu (default) skips threads that used no CPU since the last
+    sample; ?mode=wall counts blocked threads too. ?format=json returns
+    the counts with a summary instead.
+    """
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', 0.005))
+    except ValueError:
+        return jsonify({"error": "seconds and interval must be numbers"}), 400
+    mode = request.args.get('mode', 'cpu')
+    if mode not in ('cpu', 'wall'):
+        return jsonify({"error": "mode must be 'cpu' or 'wall'"}), 400
+    try:
+        counts, summary = profiling.sample_stacks(seconds, interval, mode)
+    except profiling.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    if request.args.get('format') == 'json':
+        return jsonify({"summary": summary, "stacks": counts})
+    response = Response(profiling.collapse(counts), mimetype='text/plain')
+    response.headers['X-Profile-Summary'] = serialization.dumps(summary)
+    return response
+
+@app.route('/admin/profile/memory', methods=['GET', 'POST', 'DELETE'])
+@admin_required
+def profile_memory():
+    """
+    tracemalloc control: POST starts tracing (?frames=), DELETE stops it,
+    GET shows status and per-endpoint allocation growth since start
+    """
+    if request.method == 'POST':
+        try:
+            frames = int(request.args.get('frames', 10))
+        except ValueError:
+            return jsonify({"error": "frames must be an integer"}), 400
+        allocation_tracker.start(frames)
+    elif request.method == 'DELETE':
+        allocation_tracker.stop()
+    return jsonify(dict(allocation_tracker.status(), endpoints=allocation_tracker.endpoints()))
+
+@app.route('/admin/profile/memory/snapshots/<name>', methods=['POST', 'GET'])
+@admin_required
+def profile_memory_snapshot(name):
+    """
+    POST takes a snapshot stored as <name> and returns its top allocation
+    sites; GET returns growth since snapshot <name>. Both accept ?limit=,
+    ?group=lineno|filename|traceback and ?filter= (file path substring,
+    e.g. ollama_service).
+    """
+    group = request.args.get('group', 'lineno')
+    if group not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"error": "group must be lineno, filename or traceback"}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    file_filter = request.args.get('filter')
+    if not allocation_tracker.active:
+        return jsonify({"error": "tracemalloc is not tracing; POST /admin/profile/memory first"}), 409
+    if request.method == 'POST':
+        return jsonify({"snapshot": name, "top": allocation_tracker.top(name, limit, group, file_filter)})
+    try:
+        return jsonify({"base": name, "diff": allocation_tracker.diff(name, limit, group, file_filter)})
+    except KeyError:
+        return jsonify({"error": f"No snapshot named '{name}'"}), 404
+
 @app.route('/config', methods=['GET'])
 def get_config():
     """Expose current backend configuration (safe subset)"""
-    return jsonify({
-        "model": Config.MODEL_NAME,
-        "ollama_host": Config.OLLAMA_HOST,
-        "ollama_port": Config.OLLAMA_PORT,
-        "keep_alive": getattr(Config, 'KEEP_ALIVE', None),
-        "use_fallback_first": Config.USE_FALLBACK_FIRST,
-        "max_tokens": Config.MAX_TOKENS,
-        "temperature": Config.TEMPERATURE,
-        "top_p": Config.TOP_P
-    })
+    return config_body.get().response()
+
 
 if __name__ == '__main__':
     print("🚀 Starting Code Whisper Backend...")
     print(f"📡 Using model: {Config.MODEL_NAME}")
     print(f"🔗 Backend will be available at http://{Config.HOST}:{Config.PORT}")
     
-    # Check Ollama availability on startup
-    if ollama_service.is_available():
+    # Check Ollama availability on startup (in the background unless STARTUP_MODE=eager)
+    if Config.STARTUP_MODE != 'eager':
+        readiness.start()
+        print("⏳ Checking Ollama in the background; see /ready")
+    elif ollama_service.is_available():
         print("✅ Ollama service is available")
     else:
         print("⚠️  Warning: Ollama service is not available")
@@ -0,0 +1,49 @@
+import gzip
+from typing import Dict, Optional
+
+# Optional brotli support; gzip is always available
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on environment
+    brotli = None
+
+SUPPORTED_ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+# Per-response compression trades ratio for latency; the maximum levels are for precompression
+DYNAMIC_LEVELS = {'gzip': 6, 'br': 5}
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress ``data`` with 'gzip' or 'br'"""
+    if encoding == 'gzip':
+        # mtime=0 keeps output deterministic so precompressed assets hash the same every start
+        return gzip.compress(data, compresslevel=9 if level is None else level, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11 if level is None else level)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compress_all(data: bytes) -> Dict[str, bytes]:
+    """Every supported encoding that actually makes ``data`` smaller"""
+    variants = {}
+    for encoding in SUPPORTED_ENCODINGS:
+        compressed = compress(data, encoding)
+        if len(compressed) < len(data):
+            variants[encoding] = compressed
+    return variants
+
+
+def choose_encoding(accept_encodings, available) -> Optional[str]:
+    """
+    Pick the best encoding the client accepts from ``available``
+
+    ``accept_encodings`` is Werkzeug's parsed Accept-Encoding header;
+    returns None when the identity body should be sent.
+    """
+    best = None
+    best_quality = 0.0
+    for encoding in available:
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
@@ -1,8 +1,12 @@
 import os
-from dotenv import load_dotenv
+from types import MappingProxyType
+from typing import Any, Mapping, Optional
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env (deployments that inject the environment
+# can set LOAD_DOTENV=False to skip importing python-dotenv at all)
+if os.getenv('LOAD_DOTENV', 'True').lower() == 'true':
+    from dotenv import load_dotenv
+    load_dotenv()
 
 class Config:
     """Configuration class for Code Whisper backend"""
@@ -12,6 +16,9 @@ class Config:
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', 5000))
     
+    # Serve frontend assets hashed, precompressed and from memory (disable while editing the frontend)
+    STATIC_PIPELINE = os.getenv('STATIC_PIPELINE', 'True').lower() == 'true'
+    
     # Ollama configuration
     OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'localhost')
     OLLAMA_PORT = int(os.getenv('OLLAMA_PORT', 11434))
@@ -27,6 +34,14 @@ class Config:
     STREAM_TIMEOUT = int(os.getenv('STREAM_TIMEOUT', 600))   # Stream read timeout (seconds)
     FALLBACK_DELAY_SECONDS = int(os.getenv('FALLBACK_DELAY_SECONDS', 0))  # Wait before using fallback
     
+    # Per-mode num_predict learned from completion lengths (MODE_TOKEN_BUDGETS are the starting points);
+    # with ADAPTIVE_TOKENS off every mode uses MAX_TOKENS
+    ADAPTIVE_TOKENS = os.getenv('ADAPTIVE_TOKENS', 'True').lower() == 'true'
+    MIN_NUM_PREDICT = int(os.getenv('MIN_NUM_PREDICT', 64))
+    MAX_NUM_PREDICT = int(os.getenv('MAX_NUM_PREDICT', 768))
+    # Stop streamed answers once the requested structure (sections/bullets) is complete
+    STRUCTURAL_EARLY_STOP = os.getenv('STRUCTURAL_EARLY_STOP', 'True').lower() == 'true'
+    
     # Prefer local model by default; fallback only on failure
     USE_FALLBACK_FIRST = os.getenv('USE_FALLBACK_FIRST', 'False').lower() == 'true'
     
@@ -34,9 +49,83 @@ class Config:
     OLLAMA_NUM_CTX = int(os.getenv('OLLAMA_NUM_CTX', 2048))  # Context window size
     OLLAMA_NUM_GPU = int(os.getenv('OLLAMA_NUM_GPU', 0))  # Use CPU by default
     
+    # Precomputed explanation store (SQLite); only used when the file exists
+    EXPLANATION_STORE_PATH = os.getenv('EXPLANATION_STORE_PATH', 'data/explanations.db')
+    
+    # Generated explanation cache
+    EXPLANATION_CACHE_SIZE = int(os.getenv('EXPLANATION_CACHE_SIZE', 512))  # 0 disables
+    EXPLANATION_CACHE_TTL = float(os.getenv('EXPLANATION_CACHE_TTL', 3600))
+    
+    # 'single' keeps cache, rate limits and metrics in-process; 'prefork' shares
+    # them between worker processes through a local SQLite WAL database
+    DEPLOYMENT_MODE = os.getenv('DEPLOYMENT_MODE', 'single').lower()
+    SHARED_STATE_PATH = os.getenv('SHARED_STATE_PATH', 'data/shared_state.db')
+    
+    # Per-client rate limiting (token bucket keyed by API key or IP); 0 disables
+    RATE_LIMIT_PER_MINUTE = float(os.getenv('RATE_LIMIT_PER_MINUTE', 30))
+    RATE_LIMIT_BURST = float(os.getenv('RATE_LIMIT_BURST', 10))
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')  # 'memory', 'shared' or 'module:ClassName'
+    # Comma-separated X-API-Key values that get their own quota; other callers are limited by IP
+    API_KEYS = frozenset(key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip())
+    CLIENT_IDLE_TTL = float(os.getenv('CLIENT_IDLE_TTL', 3600))  # forget usage of clients idle this long
+    
+    # Fair-share scheduling of upstream generations across clients
+    GENERATION_SLOTS = int(os.getenv('GENERATION_SLOTS', 1))  # concurrent Ollama generations
+    SCHEDULER_QUANTUM = float(os.getenv('SCHEDULER_QUANTUM', 1.0))
+    QUEUE_TIMEOUT = float(os.getenv('QUEUE_TIMEOUT', 300))  # max seconds waiting for a slot
+    # Generations still running this long after the request arrived are cancelled (queueing included);
+    # 0 (default) disables. Keep it above REQUEST_TIMEOUT/STREAM_TIMEOUT for slow CPU generations
+    REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', 0))
+    
+    # WebSocket multiplexing (/ws)
+    WS_MAX_STREAMS = int(os.getenv('WS_MAX_STREAMS', 8))  # concurrent streams per connection
+    WS_SEND_QUEUE = int(os.getenv('WS_SEND_QUEUE', 256))  # queued events before producers block
+    WS_PING_INTERVAL = float(os.getenv('WS_PING_INTERVAL', 25))  # seconds between keepalive pings; 0 disables
+    
+    # Request tracing (OTLP/JSON spans); TRACING_EXPORT is '' (off), 'file' or 'otlp'
+    TRACING_EXPORT = os.getenv('TRACING_EXPORT', '').lower()
+    TRACE_FILE = os.getenv('TRACE_FILE', 'data/traces.jsonl')
+    TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT', 'http://localhost:4318/v1/traces')
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.05))  # fraction of traces exported
+    TRACE_SLOW_SECONDS = float(os.getenv('TRACE_SLOW_SECONDS', 0))  # also export any slower trace; 0 disables
+    
+    # 'eager' builds everything at import; 'lazy' builds the Ollama service and static
+    # assets on first use; 'background' starts building them and probing Ollama at import
+    STARTUP_MODE = os.getenv('STARTUP_MODE', 'eager').lower()
+    READINESS_INTERVAL = float(os.getenv('READINESS_INTERVAL', 30))  # seconds between /ready probes
+    
+    # Capture of explain requests to rotating JSONL files for replay (benchmarks/replay_traffic.py)
+    CAPTURE_ENABLED = os.getenv('CAPTURE_ENABLED', 'False').lower() == 'true'
+    CAPTURE_DIR = os.getenv('CAPTURE_DIR', 'data/capture')
+    CAPTURE_CODE = os.getenv('CAPTURE_CODE', 'hash').lower()  # 'hash' or 'content' (stores snippets verbatim)
+    CAPTURE_MAX_BYTES = int(os.getenv('CAPTURE_MAX_BYTES', 64 * 1024 * 1024))  # rotate after this size
+    CAPTURE_MAX_FILES = int(os.getenv('CAPTURE_MAX_FILES', 20))
+    CAPTURE_SALT = os.getenv('CAPTURE_SALT', '')  # set to keep client hashes stable across workers and restarts
+    
+    # Negotiated gzip/brotli for non-streamed JSON responses
+    RESPONSE_COMPRESSION = os.getenv('RESPONSE_COMPRESSION', 'True').lower() == 'true'
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))  # smaller bodies are sent as is
+    
+    # Admin-only endpoints (/admin/...); disabled unless a token is set
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+    
     # Validation limits
     MAX_CODE_LENGTH = int(os.getenv('MAX_CODE_LENGTH', 10000))  # 10KB limit
     MIN_CODE_LENGTH = int(os.getenv('MIN_CODE_LENGTH', 1))
+    # Raw body cap enforced before parsing; leaves room for JSON escaping of MAX_CODE_LENGTH chars
+    MAX_REQUEST_BYTES = int(os.getenv('MAX_REQUEST_BYTES', MAX_CODE_LENGTH * 6 + 4096))
+
+_snapshot: Optional[Mapping[str, Any]] = None
+
+
+def snapshot() -> Mapping[str, Any]:
+    """Read-only copy of every Config setting, built once per process"""
+    global _snapshot
+    if _snapshot is None:
+        _snapshot = MappingProxyType({
+            name: getattr(Config, name) for name in dir(Config) if name.isupper()
+        })
+    return _snapshot
 
 # Mode prompts - separated for better maintainability
 MODE_PROMPTS = {
@@ -56,4 +145,18 @@ MODE_PROMPTS = {
         "You are a strict code reviewer. Output ONLY critical feedback and actionable improvements. "
         "No restating the code. Sections: Issues, Risks, Refactor Suggestions. Be direct and terse."
     ),
-}
\ No newline at end of file
+}
+
+# Starting num_predict per mode, before enough completions have been observed
+MODE_TOKEN_BUDGETS = {
+    "friend": 160,
+    "professor": 384,
+    "babysitter": 256,
+    "review": 256,
+}
+
+# Ollama stop sequences: trailing summaries the structured modes never ask for
+MODE_STOP_SEQUENCES = {
+    "professor": ["\n\nConclusion", "\n\nSummary", "\n\nIn summary"],
+    "review": ["\n\nConclusion", "\n\nSummary", "\n\nOverall,"],
+}
@@ -0,0 +1,220 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_PROFILE_SECONDS = 60.0
+MIN_INTERVAL = 0.001
+
+
+class ProfilerBusy(Exception):
+    """Raised when a sampling profile is already running in this process"""
+
+
+def _thread_cpu_clock(ident: int) -> Optional[int]:
+    """Per-thread CPU clock id (Linux and most Unixes), or None"""
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> List[str]:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+_profile_lock = threading.Lock()
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, mode: str = 'cpu') -> Tuple[Dict[str, int], Dict[str, Any]]:
+    """
+    Sample every thread's Python stack for ``seconds``
+
+    In 'cpu' mode a thread is only counted when its CPU clock advanced
+    since the previous sample, so threads blocked on sockets, locks or
+    Ollama do not drown out the code that actually burns CPU; 'wall'
+    counts every thread on every sample. Returns (collapsed stack counts,
+    summary); stacks are "thread;outer;...;inner" strings.
+    """
+    seconds = max(MIN_INTERVAL, min(MAX_PROFILE_SECONDS, seconds))
+    interval = max(MIN_INTERVAL, interval)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running in this worker")
+    try:
+        me = threading.get_ident()
+        counts: Dict[str, int] = {}
+        last_cpu: Dict[int, float] = {}
+        samples = 0
+        idle_skipped = 0
+        cpu_mode = mode == 'cpu' and _thread_cpu_clock(me) is not None
+        deadline = time.monotonic() + seconds
+        started = time.perf_counter()
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                if cpu_mode:
+                    clock = _thread_cpu_clock(ident)
+                    try:
+                        cpu = time.clock_gettime(clock) if clock is not None else None
+                    except OSError:
+                        cpu = None
+                    previous = last_cpu.get(ident)
+                    if cpu is not None:
+                        last_cpu[ident] = cpu
+                        if previous is None or cpu <= previous:
+                            idle_skipped += 1
+                            continue
+                key = ";".join([names.get(ident, f"thread-{ident}")] + _stack(frame))
+                counts[key] = counts.get(key, 0) + 1
+            samples += 1
+            time.sleep(interval)
+        return counts, {
+            "mode": 'cpu' if cpu_mode else 'wall',
+            "seconds": round(time.perf_counter() - started, 3),
+            "interval": interval,
+            "samples": samples,
+            "idle_skipped": idle_skipped,
+            "pid": os.getpid(),
+        }
+    finally:
+        _profile_lock.release()
+
+
+def collapse(counts: Dict[str, int]) -> str:
+    """Brendan Gregg collapsed-stack format (flamegraph.pl, speedscope, inferno)"""
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items(), key=lambda kv: -kv[1]))
+
+
+class AllocationTracker:
+    """
+    tracemalloc control plus per-endpoint allocation accounting
+
+    While tracing, each request records how much traced memory grew or
+    shrank between its start and end. Concurrent requests share one
+    process-wide counter, so per-endpoint numbers are indicative under
+    load; snapshot diffs filtered by file show where the memory went.
+    Named snapshots are kept up to ``max_snapshots``.
+    """
+
+    def __init__(self, max_snapshots: int = 8):
+        self.max_snapshots = max_snapshots
+        self._snapshots: 'OrderedDict[str, tracemalloc.Snapshot]' = OrderedDict()
+        self._endpoints: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(max(1, frames))
+        with self._lock:
+            self._endpoints = {}
+
+    def stop(self):
+        tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+
+    def status(self) -> Dict[str, Any]:
+        current, peak = tracemalloc.get_traced_memory() if self.active else (0, 0)
+        return {
+            "tracing": self.active,
+            "frames": tracemalloc.get_traceback_limit() if self.active else 0,
+            "traced_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": list(self._snapshots),
+        }
+
+    def begin_request(self) -> Optional[int]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.get_traced_memory()[0]
+
+    def end_request(self, endpoint: Optional[str], started: Optional[int]):
+        if started is None or not tracemalloc.is_tracing():
+            return
+        delta = tracemalloc.get_traced_memory()[0] - started
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint or 'unknown', {
+                "requests": 0, "net_bytes": 0, "max_growth_bytes": 0,
+            })
+            stats["requests"] += 1
+            stats["net_bytes"] += delta
+            stats["max_growth_bytes"] = max(stats["max_growth_bytes"], delta)
+
+    def endpoints(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {name: dict(stats, avg_net_bytes=round(stats["net_bytes"] / stats["requests"], 1))
+                    for name, stats in self._endpoints.items()}
+
+    def take_snapshot(self, name: str) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = tracemalloc.take_snapshot()
+        with self._lock:
+            self._snapshots.pop(name, None)
+            self._snapshots[name] = snapshot
+            while len(self._snapshots) > self.max_snapshots:
+                self._snapshots.popitem(last=False)
+        return snapshot
+
+    @staticmethod
+    def _filtered(snapshot: tracemalloc.Snapshot, file_filter: Optional[str]) -> tracemalloc.Snapshot:
+        filters = [
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        if file_filter:
+            filters.append(tracemalloc.Filter(True, f"*{file_filter}*", all_frames=True))
+        return snapshot.filter_traces(filters)
+
+    def top(self, name: str, limit: int = 20, key_type: str = 'lineno',
+            file_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Largest allocation sites in a new snapshot stored under ``name``"""
+        snapshot = self._filtered(self.take_snapshot(name), file_filter)
+        return [
+            {"where": _format_traceback(stat.traceback), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics(key_type)[:limit]
+        ]
+
+    def diff(self, base: str, limit: int = 20, key_type: str = 'lineno',
+             file_filter: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Growth since snapshot ``base``, largest first"""
+        with self._lock:
+            old = self._snapshots.get(base)
+        if old is None:
+            raise KeyError(base)
+        new = self._filtered(tracemalloc.take_snapshot(), file_filter)
+        return [
+            {
+                "where": _format_traceback(stat.traceback),
+                "size_diff_bytes": stat.size_diff,
+                "size_bytes": stat.size,
+                "count_diff": stat.count_diff,
+            }
+            for stat in new.compare_to(self._filtered(old, file_filter), key_type)[:limit]
+        ]
+
+
+def _format_traceback(traceback: tracemalloc.Traceback) -> str:
+    # Most recent frame first, like tracemalloc's own statistics output
+    return " <- ".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in reversed(traceback))
@@ -0,0 +1,81 @@
+import json
+from typing import Any, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+# Optional fast JSON backend; stdlib json is used when it is not installed
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+_stdlib_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+    """Decode JSON directly from bytes (no intermediate str copy with orjson)"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 encoded JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _stdlib_encoder.encode(obj).encode('utf-8')
+
+
+def dumps(obj: Any) -> str:
+    """Compact JSON as str"""
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return _stdlib_encoder.encode(obj)
+
+
+def sse_event(obj: Any) -> bytes:
+    """Encode one Server-Sent Events 'data:' frame"""
+    return b"data: " + dumps_bytes(obj) + b"\n\n"
+
+
+class SSEFrames:
+    """
+    Pre-encoded frames for events whose content is fixed
+
+    Start frames only vary by mode, so they are built once per mode
+    instead of being serialized on every request.
+    """
+
+    def __init__(self, modes, model: str):
+        self.start = {mode: sse_event({'type': 'start', 'mode': mode, 'model': model}) for mode in modes}
+        self.complete = sse_event({'type': 'complete'})
+        self.internal_error = sse_event({'type': 'error', 'message': 'Internal server error'})
+        self.busy = sse_event({'type': 'error', 'message': 'Server is busy. Please try again shortly.'})
+        self.cancelled = {reason: sse_event({'type': 'cancelled', 'reason': reason})
+                          for reason in ('client', 'deadline', 'disconnected')}
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that uses orjson for jsonify() when available"""
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        # jsonify() always passes compact separators, which is orjson's only output style;
+        # anything else (indent in debug mode, custom encoders) keeps Flask's behaviour
+        if orjson is None or set(kwargs) - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+        except TypeError:
+            # Types orjson does not know (e.g. Decimal) go through Flask's default handling
+            return super().dumps(obj)
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+# Both backends raise a ValueError subclass on malformed input
+DecodeError = ValueError
@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class CancelToken:
+    """
+    Cross-thread cancellation signal for one explanation
+
+    Whoever owns an upstream resource (e.g. the streaming Ollama response)
+    registers a closer with ``on_cancel``; ``cancel()`` may be called from
+    any thread and runs the closers so a blocked read returns immediately.
+    ``reason`` records why ('client', 'disconnected', 'deadline').
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._closers: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        self.deadline = deadline  # time.monotonic() value
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def time_left(self, limit: float) -> float:
+        """``limit`` capped at the time left before the deadline (for socket timeouts)"""
+        if self.deadline is None:
+            return limit
+        return max(0.1, min(limit, self.deadline - time.monotonic()))
+
+    def clear_deadline(self):
+        """Stop the deadline from applying, e.g. once only the local fallback is left to serve"""
+        self.deadline = None
+
+    def clear_closers(self):
+        """Drop the registered closers once the work they would stop has ended"""
+        with self._lock:
+            self._closers = []
+
+    def on_cancel(self, closer: Callable[[], None]):
+        """Register a callback to run on cancel (runs now if already cancelled)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._closers.append(closer)
+                return
+        self._run(closer)
+
+    def cancel(self, reason: str = 'client'):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            closers, self._closers = self._closers, []
+        for closer in closers:
+            self._run(closer)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to ``timeout`` seconds; returns True if cancelled meanwhile"""
+        return self._event.wait(timeout)
+
+    @staticmethod
+    def _run(closer: Callable[[], None]):
+        try:
+            closer()
+        except Exception as e:
+            logger.debug(f"Cancel callback failed: {str(e)}")
+
+
+class Cancelled(Exception):
+    """Raised when a request stops waiting because its token was cancelled"""
+
+
+class ActiveRequests:
+    """
+    Cancel tokens of in-flight explanations by client and request id
+
+    Lets a request be cancelled from another request (``DELETE
+    /explain/<id>``), but only by the client that started it; request ids
+    are chosen by clients, so two clients may use the same one. Requests
+    tracked with a deadline are cancelled by one watcher thread when it
+    passes. Ids are per process, so in prefork mode a cancel only reaches
+    requests served by the same worker.
+    """
+
+    def __init__(self):
+        self._requests: Dict[Tuple[str, str], CancelToken] = {}
+        self._deadlines: List[Tuple[float, int, Tuple[str, str], CancelToken]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._watcher: Optional[threading.Thread] = None
+
+    def track(self, request_id: str, client_id: str, token: Optional[CancelToken] = None,
+              deadline: float = 0) -> CancelToken:
+        """Register a request (with a new token unless one is given); ``deadline`` in seconds, 0 for none"""
+        token = token or CancelToken()
+        key = (client_id, request_id)
+        with self._cond:
+            self._requests[key] = token
+            if deadline > 0:
+                token.deadline = time.monotonic() + deadline
+                heapq.heappush(self._deadlines, (token.deadline, next(self._sequence), key, token))
+                if self._watcher is None:
+                    self._watcher = threading.Thread(target=self._watch, name='request-deadlines', daemon=True)
+                    self._watcher.start()
+                self._cond.notify()
+        return token
+
+    def release(self, request_id: str, client_id: str, token: CancelToken):
+        """Forget a finished request, so nothing keeps its response or scheduler waiter alive"""
+        token.clear_closers()
+        key = (client_id, request_id)
+        with self._cond:
+            if self._requests.get(key) is token:
+                del self._requests[key]
+            # Finished requests leave their heap entries behind; drop them once they outnumber live ones
+            if len(self._deadlines) > 2 * len(self._requests) + 16:
+                self._deadlines = [entry for entry in self._deadlines if self._requests.get(entry[2]) is entry[3]]
+                heapq.heapify(self._deadlines)
+
+    def cancel(self, request_id: str, client_id: str, reason: str = 'client') -> bool:
+        """Cancel one of this client's requests; False if it has no such request"""
+        with self._cond:
+            token = self._requests.get((client_id, request_id))
+        if token is None:
+            return False
+        token.cancel(reason)
+        return True
+
+    def __len__(self) -> int:
+        return len(self._requests)
+
+    def _watch(self):
+        while True:
+            with self._cond:
+                while not self._deadlines or self._deadlines[0][0] > time.monotonic():
+                    self._cond.wait(self._deadlines[0][0] - time.monotonic() if self._deadlines else None)
+                _, _, key, token = heapq.heappop(self._deadlines)
+                live = self._requests.get(key) is token
+            # Requests that already finished only leave their heap entry behind
+            if live and token.expired:
+                logger.info(f"Request {key[1]} passed its deadline; cancelling")
+                token.cancel('deadline')
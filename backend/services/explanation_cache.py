@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from backend.config import Config
+
+
+class ExplanationCache:
+    """In-process LRU cache of generated explanations with a TTL"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SharedExplanationCache:
+    """Explanation cache shared by all worker processes through SharedStateStore"""
+
+    def __init__(self, store, ttl: float = 3600):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        return self.store.cache_get(key)
+
+    def put(self, key: str, value: str):
+        self.store.cache_put(key, value, self.ttl)
+
+    def __len__(self) -> int:
+        return self.store.cache_size()
+
+
+def build_cache():
+    """Cache matching Config.DEPLOYMENT_MODE ('single' or 'prefork'); None if disabled"""
+    if Config.EXPLANATION_CACHE_SIZE <= 0:
+        return None
+    if Config.DEPLOYMENT_MODE == 'prefork':
+        from backend.services.shared_state import get_shared_store
+        return SharedExplanationCache(get_shared_store(), ttl=Config.EXPLANATION_CACHE_TTL)
+    return ExplanationCache(Config.EXPLANATION_CACHE_SIZE, ttl=Config.EXPLANATION_CACHE_TTL)
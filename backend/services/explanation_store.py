@@ -0,0 +1,308 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS explanations (
+    code_hash TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (code_hash, mode, model, prompt_version)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def hash_code(code: str) -> str:
+    """Stable key for a code snippet (whitespace at the edges is ignored)"""
+    return hashlib.sha256(code.strip().encode('utf-8')).hexdigest()
+
+
+class ExplanationStore:
+    """
+    Persistent store of precomputed explanations for popular snippets
+
+    Rows live in SQLite (indexed by snippet hash, mode, model and prompt
+    version) and are mirrored into an in-memory dict on open, so lookups on
+    the request path never touch disk. Entries whose model or prompt version
+    no longer matches the running configuration are simply never hit and can
+    be removed with ``prune``.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(SCHEMA_VERSION),)
+        )
+        self._conn.commit()
+        self._memory: Dict[Tuple[str, str, str, str], str] = {}
+        self._load()
+
+    @classmethod
+    def open_existing(cls, path: Optional[str]) -> Optional['ExplanationStore']:
+        """Open the store only if the database file already exists (no side effects otherwise)"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not open explanation store at {path}: {str(e)}")
+            return None
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT code_hash, mode, model, prompt_version, explanation FROM explanations"
+        )
+        self._memory = {(r[0], r[1], r[2], r[3]): r[4] for r in rows}
+        logger.info(f"Loaded {len(self._memory)} precomputed explanations from {self.path}")
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def get(self, code_hash: str, mode: str, model: str, prompt_version: str) -> Optional[str]:
+        """Return a stored explanation from memory, or None"""
+        return self._memory.get((code_hash, mode, model, prompt_version))
+
+    def put(self, code_hash: str, mode: str, model: str, prompt_version: str,
+            explanation: str, created_at: Optional[float] = None):
+        """Insert or replace a single explanation"""
+        self.put_many([{
+            "code_hash": code_hash,
+            "mode": mode,
+            "model": model,
+            "prompt_version": prompt_version,
+            "explanation": explanation,
+            "created_at": created_at,
+        }])
+
+    def put_many(self, entries: Iterable[Dict[str, Any]]) -> int:
+        """Insert or replace entries in one transaction; returns the number written"""
+        rows = []
+        now = time.time()
+        for entry in entries:
+            rows.append((
+                entry["code_hash"],
+                entry["mode"],
+                entry["model"],
+                entry["prompt_version"],
+                entry["explanation"],
+                float(entry.get("created_at") or now),
+            ))
+        if not rows:
+            return 0
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO explanations "
+                    "(code_hash, mode, model, prompt_version, explanation, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+            for row in rows:
+                self._memory[(row[0], row[1], row[2], row[3])] = row[4]
+        return len(rows)
+
+    def iter_entries(self) -> Iterator[Dict[str, Any]]:
+        """Yield every stored row as a dict (used for export)"""
+        cursor = self._conn.execute(
+            "SELECT code_hash, mode, model, prompt_version, explanation, created_at "
+            "FROM explanations ORDER BY code_hash, mode"
+        )
+        for r in cursor:
+            yield {
+                "code_hash": r[0],
+                "mode": r[1],
+                "model": r[2],
+                "prompt_version": r[3],
+                "explanation": r[4],
+                "created_at": r[5],
+            }
+
+    def prune(self, model: str, prompt_versions: Dict[str, str]) -> int:
+        """Delete entries that do not match the given model and per-mode prompt versions"""
+        stale = [
+            key for key in self._memory
+            if key[2] != model or prompt_versions.get(key[1]) != key[3]
+        ]
+        if not stale:
+            return 0
+        with self._lock:
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM explanations "
+                    "WHERE code_hash = ? AND mode = ? AND model = ? AND prompt_version = ?",
+                    stale
+                )
+            for key in stale:
+                self._memory.pop(key, None)
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summarize the store contents"""
+        by_model: Dict[str, int] = {}
+        by_mode: Dict[str, int] = {}
+        for (_, mode, model, _) in self._memory:
+            by_model[model] = by_model.get(model, 0) + 1
+            by_mode[mode] = by_mode.get(mode, 0) + 1
+        return {
+            "path": self.path,
+            "entries": len(self._memory),
+            "by_model": by_model,
+            "by_mode": by_mode,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _iter_corpus(path: str) -> Iterator[str]:
+    """Read snippets from a directory of source files or a JSONL file with a 'code' field"""
+    if os.path.isdir(path):
+        for root, _, files in os.walk(path):
+            for name in sorted(files):
+                with open(os.path.join(root, name), encoding='utf-8', errors='replace') as f:
+                    code = f.read().strip()
+                if code:
+                    yield code
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            code = (json.loads(line).get('code') or '').strip()
+            if code:
+                yield code
+
+
+def _cmd_precompute(store: ExplanationStore, args) -> int:
+    from backend.config import Config, MODE_PROMPTS
+    from backend.services.ollama_service import OllamaService
+
+    service = OllamaService(store=store)
+    if not service.is_available():
+        print("❌ Ollama is not available; precompute needs the real model")
+        return 1
+
+    modes = args.modes.split(',') if args.modes else sorted(MODE_PROMPTS.keys())
+    written = skipped = failed = 0
+    for code in _iter_corpus(args.corpus):
+        if len(code) > Config.MAX_CODE_LENGTH:
+            skipped += 1
+            continue
+        for mode in modes:
+            key = service.store_key(code, mode)
+            if not args.force and store.get(*key) is not None:
+                skipped += 1
+                continue
+            result = service.get_explanation(code, mode, use_cache=False)
+            # Never persist smart-fallback text as if it were a model answer
+            if not result.get("success") or result.get("model") != service.model_name:
+                failed += 1
+                continue
+            store.put(*key, result["explanation"])
+            written += 1
+    print(f"✅ Precompute finished: {written} written, {skipped} skipped, {failed} failed")
+    return 0 if failed == 0 else 1
+
+
+def _cmd_export(store: ExplanationStore, args) -> int:
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    count = 0
+    try:
+        for entry in store.iter_entries():
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            count += 1
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"✅ Exported {count} entries", file=sys.stderr)
+    return 0
+
+
+def _cmd_import(store: ExplanationStore, args) -> int:
+    with open(args.input, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f if line.strip()]
+    count = store.put_many(entries)
+    print(f"✅ Imported {count} entries")
+    return 0
+
+
+def _cmd_prune(store: ExplanationStore, args) -> int:
+    from backend.config import MODE_PROMPTS
+    from backend.services.ollama_service import OllamaService
+
+    service = OllamaService(store=store)
+    versions = {mode: service.prompt_version(mode) for mode in MODE_PROMPTS}
+    removed = store.prune(service.model_name, versions)
+    print(f"✅ Removed {removed} stale entries")
+    return 0
+
+
+def _cmd_stats(store: ExplanationStore, args) -> int:
+    print(json.dumps(store.stats(), indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    from backend.config import Config
+
+    parser = argparse.ArgumentParser(description="Manage the precomputed explanation store")
+    parser.add_argument('--db', default=Config.EXPLANATION_STORE_PATH, help="SQLite database path")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('precompute', help="Generate explanations for a corpus with the configured model")
+    p.add_argument('corpus', help="Directory of snippets or JSONL file with a 'code' field")
+    p.add_argument('--modes', help="Comma-separated modes (default: all)")
+    p.add_argument('--force', action='store_true', help="Regenerate entries that already exist")
+    p.set_defaults(func=_cmd_precompute)
+
+    p = sub.add_parser('export', help="Write all entries as JSONL")
+    p.add_argument('output', nargs='?', default='-')
+    p.set_defaults(func=_cmd_export)
+
+    p = sub.add_parser('import', help="Load entries from a JSONL export")
+    p.add_argument('input')
+    p.set_defaults(func=_cmd_import)
+
+    p = sub.add_parser('prune', help="Drop entries for other models or outdated prompts")
+    p.set_defaults(func=_cmd_prune)
+
+    p = sub.add_parser('stats', help="Show entry counts")
+    p.set_defaults(func=_cmd_stats)
+
+    args = parser.parse_args(argv)
+    store = ExplanationStore(args.db)
+    try:
+        return args.func(store, args)
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,238 @@
+import re
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from backend.config import MODE_STOP_SEQUENCES
+
+# Sections each structured mode is asked for (see MODE_PROMPTS)
+MODE_SECTIONS = {
+    "professor": ["Purpose", "Flow", "Key Concepts", "Complexity", "Edge Cases"],
+    "review": ["Issues", "Risks", "Refactor Suggestions"],
+}
+
+# Lines per section before the answer is considered complete ("2-3 lines", "terse")
+SECTION_LINE_LIMITS = {
+    "professor": 4,
+    "review": 6,
+}
+
+# friend asks for 5-8 bullets plus one tip; anything past that is rambling
+MAX_BULLETS = {
+    "friend": 9,
+}
+
+_HEADING_PREFIX = r'^\s*(?:#{1,6}\s*|\*\*|\d+[.)]\s*)?'
+# Markdown heading at top level ("## Notes"); lines like "Example:" are content, not sections
+_MARKDOWN_HEADING = re.compile(r'^#{1,6}\s+\S')
+_FENCE = re.compile(r'^\s*(?:```|~~~)')
+_BULLET = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s+\S')
+
+
+class StructureTracker:
+    """
+    Watches a streamed answer line by line and reports when it is complete
+
+    For sectioned modes the answer is done once every requested section has
+    appeared and the last one has its content (or an extra, unrequested
+    section starts). For bullet modes it stops once the bullet allowance is
+    used up. Stopping there closes the upstream request, so Ollama does not
+    spend CPU on a summary nobody asked for.
+    """
+
+    def __init__(self, mode: str):
+        self.sections = [
+            re.compile(_HEADING_PREFIX + re.escape(name) + r'\b\s*(?:\*\*)?\s*:?\s*(?:\*\*)?\s*(.*)$', re.IGNORECASE)
+            for name in MODE_SECTIONS.get(mode, [])
+        ]
+        # The closing sections the mode's stop sequences already guard against ("Conclusion", "Overall,")
+        trailing = [stop.strip().rstrip(',:') for stop in MODE_STOP_SEQUENCES.get(mode, [])]
+        self.trailing_heading = re.compile(
+            _HEADING_PREFIX + '(?:' + '|'.join(re.escape(name) for name in trailing) + r')\b', re.IGNORECASE
+        ) if trailing else None
+        self.line_limit = SECTION_LINE_LIMITS.get(mode)
+        self.max_bullets = MAX_BULLETS.get(mode)
+        self._seen = set()
+        self._last_section_lines = 0
+        self._bullets = 0
+        self._in_fence = False
+        self._partial = ""
+        self._offset = 0
+        self.stop_reason: Optional[str] = None
+        # Length of the streamed text that belongs to the answer once stopped
+        self.end: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        return bool(self.sections or self.max_bullets)
+
+    @property
+    def holding(self) -> bool:
+        """True while the line being streamed may still be cut from the answer (an extra heading)"""
+        return (bool(self.sections) and not self.stop_reason and not self._in_fence
+                and len(self._seen) == len(self.sections))
+
+    def feed(self, text: str) -> bool:
+        """Add streamed text; returns True when generation can stop"""
+        if not self.active or self.stop_reason:
+            return bool(self.stop_reason)
+        self._partial += text
+        while "\n" in self._partial:
+            line, self._partial = self._partial.split("\n", 1)
+            start, self._offset = self._offset, self._offset + len(line) + 1
+            if self._line(line):
+                # An unrequested heading is not part of the answer
+                self.end = start if self.stop_reason == "extra_section" else self._offset
+                return True
+        return False
+
+    def _line(self, line: str) -> bool:
+        if not line.strip():
+            return False
+
+        if _FENCE.match(line):
+            # Nothing inside a code block is a heading or bullet, and it is never cut;
+            # the closing fence counts as one line of the section
+            self._in_fence = not self._in_fence
+            if self._in_fence:
+                return False
+        elif self._in_fence:
+            return False
+
+        if self.max_bullets and _BULLET.match(line):
+            self._bullets += 1
+            if self._bullets >= self.max_bullets:
+                self.stop_reason = "bullet_limit"
+                return True
+
+        if not self.sections:
+            return False
+
+        all_seen = len(self._seen) == len(self.sections)
+        for index, pattern in enumerate(self.sections):
+            match = pattern.match(line)
+            if match and index not in self._seen:
+                self._seen.add(index)
+                # Content on the heading line itself ("Issues: none") counts as a line
+                self._last_section_lines = 1 if match.group(1).strip() else 0
+                return False
+
+        if all_seen and self._last_section_lines > 0 and self._extra_heading(line):
+            # An extra section (e.g. "Conclusion:") after all requested ones
+            self.stop_reason = "extra_section"
+            return True
+
+        self._last_section_lines += 1
+        if all_seen and self.line_limit and self._last_section_lines >= self.line_limit:
+            self.stop_reason = "sections_complete"
+            return True
+        return False
+
+    def _extra_heading(self, line: str) -> bool:
+        if self.trailing_heading is not None and self.trailing_heading.match(line):
+            return True
+        return bool(_MARKDOWN_HEADING.match(line))
+
+
+class GenerationBudgets:
+    """
+    Per-mode num_predict learned from observed completion lengths
+
+    Each mode keeps a window of recent completion token counts. Once enough
+    samples exist, the budget is the 95th percentile of that window plus
+    headroom. If too many answers hit the limit, the budget is raised.
+    The budget always stays within [minimum, maximum].
+    """
+
+    HEADROOM = 1.15
+    TRUNCATION_RATE = 0.1
+    MIN_SAMPLES = 20
+
+    def __init__(self, initial: Dict[str, int], minimum: int, maximum: int,
+                 window: int = 200, adaptive: bool = True, fixed: Optional[int] = None):
+        self.initial = dict(initial)
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.window = window
+        self.adaptive = adaptive
+        self.fixed = fixed
+        self._samples: Dict[str, Deque[Tuple[int, bool]]] = {}
+        self._budgets: Dict[str, int] = {}
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _clamp(self, value: float) -> int:
+        return int(min(self.maximum, max(self.minimum, value)))
+
+    def num_predict(self, mode: str) -> int:
+        if not self.adaptive and self.fixed:
+            return self.fixed
+        with self._lock:
+            budget = self._budgets.get(mode)
+        if budget is None:
+            budget = self._clamp(self.initial.get(mode, self.fixed or self.minimum))
+        return budget
+
+    def _mode_stats(self, mode: str) -> Dict[str, float]:
+        # Lock held
+        return self._stats.setdefault(mode, {
+            "completions": 0, "tokens": 0, "truncated": 0,
+            "early_stops": 0, "tokens_saved_early_stop": 0,
+            "cancelled": 0, "tokens_saved_cancel": 0,
+        })
+
+    def observe(self, mode: str, tokens: int, truncated: bool, early_stop: bool = False):
+        """Record one finished generation and re-derive the mode's budget"""
+        budget = self.num_predict(mode)
+        with self._lock:
+            stats = self._mode_stats(mode)
+            stats["completions"] += 1
+            stats["tokens"] += tokens
+            if truncated:
+                stats["truncated"] += 1
+            if early_stop:
+                # Upper bound on what the model could still have spent under this budget
+                stats["early_stops"] += 1
+                stats["tokens_saved_early_stop"] += max(0, budget - tokens)
+
+            samples = self._samples.setdefault(mode, deque(maxlen=self.window))
+            samples.append((tokens, truncated))
+            if not self.adaptive or len(samples) < self.MIN_SAMPLES:
+                return
+            lengths = sorted(t for t, _ in samples)
+            p95 = lengths[min(len(lengths) - 1, int(len(lengths) * 0.95))]
+            target = p95 * self.HEADROOM
+            truncation_rate = sum(1 for _, t in samples if t) / len(samples)
+            if truncation_rate > self.TRUNCATION_RATE:
+                target = max(target, budget * 1.25)
+            self._budgets[mode] = self._clamp(target)
+
+    def cancelled(self, mode: str, tokens: int) -> int:
+        """
+        Record a generation abandoned after ``tokens`` tokens; returns the tokens saved
+
+        Like early stops, the saving is an upper bound: the rest of the budget.
+        Cancelled generations are not samples, since their length says nothing
+        about how long answers are.
+        """
+        saved = max(0, self.num_predict(mode) - tokens)
+        with self._lock:
+            stats = self._mode_stats(mode)
+            stats["cancelled"] += 1
+            stats["tokens_saved_cancel"] += saved
+        return saved
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        """Per-mode budget, average length, truncations and tokens saved by early stopping or cancellation"""
+        with self._lock:
+            modes = set(self._stats) | set(self.initial)
+            stats = {mode: dict(self._stats.get(mode, {})) for mode in modes}
+        report = {}
+        for mode in sorted(modes):
+            entry = stats[mode]
+            completions = entry.get("completions", 0)
+            entry["budget"] = self.num_predict(mode)
+            entry["avg_tokens"] = round(entry.get("tokens", 0) / completions, 1) if completions else 0
+            report[mode] = entry
+        return report
+
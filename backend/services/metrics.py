@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+from backend.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class Metrics:
+    """Process-local counters"""
+
+    def __init__(self):
+        self._counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._counters)
+
+
+class SharedMetrics(Metrics):
+    """
+    Counters aggregated across worker processes
+
+    Increments are buffered locally and written to the shared store by a
+    per-process flusher thread every ``flush_interval`` seconds, so hot
+    paths never wait on SQLite for a counter bump and idle workers still
+    publish what they counted. The thread is started on first use in each
+    process, since threads do not survive a fork.
+    """
+
+    def __init__(self, store, flush_interval: float = 1.0):
+        super().__init__()
+        self.store = store
+        self.flush_interval = flush_interval
+        self._flusher_pid = None
+
+    def incr(self, name: str, amount: float = 1):
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+        super().incr(name, amount)
+
+    def _start_flusher(self):
+        with self._lock:
+            pid = os.getpid()
+            if self._flusher_pid == pid:
+                return
+            if self._flusher_pid is not None:
+                # Forked: the parent's pending deltas are the parent's to flush
+                self._counters = {}
+            self._flusher_pid = pid
+        threading.Thread(target=self._run, name='metrics-flusher', daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning(f"Could not flush shared metrics: {str(e)}")
+
+    def flush(self):
+        with self._lock:
+            deltas, self._counters = self._counters, {}
+        if not deltas:
+            return
+        try:
+            self.store.add_counters(deltas)
+        except Exception:
+            # Keep the deltas for the next attempt rather than losing them
+            with self._lock:
+                for name, value in deltas.items():
+                    self._counters[name] = self._counters.get(name, 0) + value
+            raise
+
+    def snapshot(self) -> Dict[str, float]:
+        self.flush()
+        return self.store.counters()
+
+
+def build_metrics() -> Metrics:
+    """Metrics matching Config.DEPLOYMENT_MODE"""
+    if Config.DEPLOYMENT_MODE == 'prefork':
+        from backend.services.shared_state import get_shared_store
+        return SharedMetrics(get_shared_store())
+    return Metrics()
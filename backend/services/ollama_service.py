@@ -1,17 +1,27 @@
 import requests
 import logging
-import json
+import re
 import time
-from typing import Optional, Dict, Any
-from backend.config import Config
+import hashlib
+from typing import Optional, Dict, Any, Tuple
+from backend.config import Config, MODE_PROMPTS, MODE_STOP_SEQUENCES, MODE_TOKEN_BUDGETS, snapshot as config_snapshot
+from backend import serialization, tracing
+from backend.services.cancellation import CancelToken
+from backend.services.explanation_cache import build_cache
+from backend.services.explanation_store import ExplanationStore, hash_code
+from backend.services.generation_budget import GenerationBudgets, StructureTracker
+from backend.services.metrics import Metrics
 
 logger = logging.getLogger(__name__)
 
+_WORD_CHUNK = re.compile(r'\s*\S+\s*')
+
 class OllamaService:
     """Service class for interacting with Ollama API"""
     
-    def __init__(self):
+    def __init__(self, store: Optional[ExplanationStore] = None, cache=None, metrics: Optional[Metrics] = None):
         self.url = Config.OLLAMA_URL
+        self.tags_url = f"http://{Config.OLLAMA_HOST}:{Config.OLLAMA_PORT}/api/tags"
         self.model_name = Config.MODEL_NAME
         self.timeout = Config.REQUEST_TIMEOUT
         self.keep_alive = getattr(Config, 'KEEP_ALIVE', None)
@@ -21,6 +31,31 @@ class OllamaService:
             'Accept': 'application/json',
             'Content-Type': 'application/json'
         })
+        # precomputed answers for popular snippets, served without calling Ollama
+        self.store = store if store is not None else ExplanationStore.open_existing(
+            getattr(Config, 'EXPLANATION_STORE_PATH', None)
+        )
+        self._prompt_versions: Dict[str, str] = {}
+        # generated explanations (per process, or shared by workers in prefork mode)
+        self.cache = cache if cache is not None else build_cache()
+        self.metrics = metrics if metrics is not None else Metrics()
+        # per-mode num_predict learned from how long answers actually are
+        self.budgets = GenerationBudgets(
+            MODE_TOKEN_BUDGETS,
+            minimum=Config.MIN_NUM_PREDICT,
+            maximum=Config.MAX_NUM_PREDICT,
+            adaptive=Config.ADAPTIVE_TOKENS,
+            fixed=Config.MAX_TOKENS,
+        )
+        self.tracer = tracing.get_tracer()
+        # sampling options are fixed for the life of the process; only num_predict varies
+        settings = config_snapshot()
+        self._options = {
+            "temperature": settings['TEMPERATURE'],
+            "top_p": settings['TOP_P'],
+            "num_ctx": settings['OLLAMA_NUM_CTX'],
+            "num_gpu": settings['OLLAMA_NUM_GPU'],
+        }
         
     def is_available(self) -> bool:
         """
@@ -31,34 +66,139 @@ class OllamaService:
         """
         try:
             # Try to get model list to check if Ollama is running
-            response = self.session.get(
-                f"http://{Config.OLLAMA_HOST}:{Config.OLLAMA_PORT}/api/tags",
-                timeout=5
-            )
+            with self.tracer.span("ollama.is_available", kind=tracing.KIND_CLIENT):
+                response = self.session.get(
+                    self.tags_url,
+                    timeout=5,
+                    headers=tracing.inject({})
+                )
             return response.status_code == 200
         except Exception as e:
             logger.warning(f"Ollama not available: {str(e)}")
             return False
     
-    def get_explanation(self, code: str, mode: str) -> Dict[str, Any]:
+    def prompt_version(self, mode: str) -> str:
+        """Short fingerprint of the full prompt template used for a mode"""
+        mode_alias = "review" if mode == "senior" else mode
+        version = self._prompt_versions.get(mode_alias)
+        if version is None:
+            mode_prompt = MODE_PROMPTS.get(mode_alias, MODE_PROMPTS["friend"])
+            template = self.create_prompt("{code}", mode_prompt)
+            version = hashlib.sha256(template.encode('utf-8')).hexdigest()[:16]
+            self._prompt_versions[mode_alias] = version
+        return version
+
+    def store_key(self, code: str, mode: str) -> Tuple[str, str, str, str]:
+        """Explanation store key: (code hash, mode, model, prompt version)"""
+        mode_alias = "review" if mode == "senior" else mode
+        return (hash_code(code), mode_alias, self.model_name, self.prompt_version(mode_alias))
+
+    def lookup_precomputed(self, code: str, mode: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a precomputed explanation for this snippet, if one exists
+        for the current model and prompt version
+        """
+        if not self.store:
+            return None
+        explanation = self.store.get(*self.store_key(code, mode))
+        if explanation is None:
+            return None
+        return {
+            "success": True,
+            "explanation": explanation,
+            "model": self.model_name,
+            "mode": mode,
+            "precomputed": True
+        }
+
+    def lookup_cached(self, code: str, mode: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a precomputed or previously generated explanation, if any
+
+        Callers that get None should generate with ``use_cache=False`` so
+        the lookup (and its metrics) happens once per request.
+        """
+        with self.tracer.span("cache.lookup") as span:
+            result = self._lookup_cached(code, mode)
+            if result is None:
+                span.set_attribute("cache.result", "miss")
+            else:
+                span.set_attribute("cache.result", "precomputed" if result.get("precomputed") else "hit")
+            return result
+
+    def _lookup_cached(self, code: str, mode: str) -> Optional[Dict[str, Any]]:
+        precomputed = self.lookup_precomputed(code, mode)
+        if precomputed:
+            self.metrics.incr('precomputed_hits')
+            return precomputed
+        if self.cache is None:
+            return None
+        explanation = self.cache.get("|".join(self.store_key(code, mode)))
+        if explanation is None:
+            self.metrics.incr('cache_misses')
+            return None
+        self.metrics.incr('cache_hits')
+        return {
+            "success": True,
+            "explanation": explanation,
+            "model": self.model_name,
+            "mode": mode,
+            "cached": True
+        }
+
+    def _remember(self, code: str, mode: str, explanation: str):
+        """Cache a real model answer (fallback text is never cached)"""
+        self.metrics.incr('generations')
+        if self.cache is not None and explanation:
+            self.cache.put("|".join(self.store_key(code, mode)), explanation)
+
+    def stream_result(self, result: Dict[str, Any]):
+        """Stream an already available explanation as one chunk plus 'done'"""
+        explanation = result["explanation"]
+        yield {
+            "type": "chunk",
+            "content": explanation
+        }
+        done = {
+            "type": "done",
+            "full_text": explanation,
+            "model": result.get("model", self.model_name),
+            "cached": True
+        }
+        if result.get("precomputed"):
+            done["precomputed"] = True
+        yield done
+
+    def get_explanation(self, code: str, mode: str, use_cache: bool = True,
+                        cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
         """
         Get code explanation from Ollama
         
         Args:
             code (str): The code to explain
             mode (str): The explanation mode/personality
+            use_cache (bool): Serve precomputed or cached answers when available
+            cancel (CancelToken): Optional token; the answer is then generated
+                through the streaming API so cancelling stops Ollama mid-answer
             
         Returns:
             Dict[str, Any]: Response containing explanation or error
         """
+        if use_cache:
+            cached = self.lookup_cached(code, mode)
+            if cached:
+                return cached
+
         # Check if we should use fallback first due to memory constraints
         if Config.USE_FALLBACK_FIRST:
             logger.info("Using smart fallback due to memory optimization setting")
             return self._get_fallback_explanation(code, mode)
+
+        if cancel is not None:
+            return self._collect_stream(code, mode, cancel)
             
         try:
             # Get the mode prompt from config
-            from backend.config import MODE_PROMPTS
             mode_alias = "review" if mode == "senior" else mode
             mode_prompt = MODE_PROMPTS.get(mode_alias, MODE_PROMPTS["friend"])
             prompt = self.create_prompt(code, mode_prompt)
@@ -68,14 +208,9 @@ class OllamaService:
                 "model": self.model_name,
                 "prompt": prompt,
                 "stream": False,
-                "options": {
-                    "temperature": Config.TEMPERATURE,
-                    "top_p": Config.TOP_P,
-                    "num_predict": Config.MAX_TOKENS,
-                    "num_ctx": getattr(Config, 'OLLAMA_NUM_CTX', 2048),
-                    "num_gpu": getattr(Config, 'OLLAMA_NUM_GPU', 0)
-                }
+                "options": dict(self._options, num_predict=self.budgets.num_predict(mode_alias))
             }
+            self._add_stop_sequences(payload, mode_alias)
             
             logger.info(f"Sending request to Ollama at {self.url}")
             logger.debug(f"Payload: {payload}")
@@ -84,13 +219,21 @@ class OllamaService:
             # Attach keep_alive if configured
             if self.keep_alive:
                 payload['keep_alive'] = self.keep_alive
-            response = self.session.post(self.url, json=payload, timeout=self.timeout or 90)
+            with self.tracer.span("ollama.generate", kind=tracing.KIND_CLIENT,
+                                  attributes=self._span_attributes(mode_alias, payload)) as span:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout or 90,
+                                             headers=tracing.inject({}))
+                span.set_attribute("http.status_code", response.status_code)
+                result = serialization.loads(response.content) if response.status_code == 200 else None
+                if result is not None:
+                    self._trace_generation(span, result)
             
-            if response.status_code == 200:
-                result = response.json()
+            if result is not None:
                 explanation = result.get('response', '').strip()
+                self._observe_generation(mode_alias, result, fallback_tokens=len(self._split_words(explanation)))
                 
                 if explanation:
+                    self._remember(code, mode, explanation)
                     return {
                         "success": True,
                         "explanation": explanation,
@@ -127,10 +270,43 @@ class OllamaService:
                 "error": f"Unexpected error: {str(e)}"
             }
 
+    def _collect_stream(self, code: str, mode: str, cancel: CancelToken) -> Dict[str, Any]:
+        """
+        Non-stream answer assembled from a streamed generation
+
+        A non-stream request to Ollama cannot be interrupted once sent; a
+        streamed one stops as soon as its response is closed.
+        """
+        done = None
+        events = self.get_explanation_stream(code, mode, cancel=cancel, use_cache=False,
+                                             read_timeout=self.timeout or 90)
+        for event in events:
+            if event["type"] == "done":
+                done = event
+        if done is None and cancel.cancelled:
+            return {
+                "success": False,
+                "cancelled": cancel.reason,
+                "error": "Request cancelled" if cancel.reason != 'deadline' else "Request deadline exceeded"
+            }
+        explanation = done["full_text"].strip() if done else ""
+        if not explanation:
+            return {
+                "success": False,
+                "error": "Empty response from AI model"
+            }
+        return {
+            "success": True,
+            "explanation": explanation,
+            "model": done["model"],
+            "mode": mode
+        }
+
     def _get_fallback_explanation(self, code: str, mode: str) -> Dict[str, Any]:
         """
         Provide a smart, code-specific fallback explanation
         """
+        self.metrics.incr('fallbacks')
         # Get detailed analysis of the specific code
         language = self._detect_language(code)
         specific_analysis = self._get_detailed_code_analysis(code)
@@ -176,21 +352,37 @@ You're doing such a great job learning to code! 🌟"""
             "mode": mode
         }
     
-    def get_explanation_stream(self, code: str, mode: str):
+    def get_explanation_stream(self, code: str, mode: str, cancel: Optional[CancelToken] = None,
+                               use_cache: bool = True, read_timeout: Optional[float] = None):
         """
         Get streaming code explanation from Ollama
         
         Args:
             code (str): The code to explain
             mode (str): The explanation mode/personality
+            cancel (CancelToken): Optional token; cancelling closes the upstream
+                request so Ollama stops generating
+            use_cache (bool): Serve precomputed or cached answers when available
+            read_timeout (float): Seconds to wait for Ollama's next chunk
+                (defaults to STREAM_TIMEOUT)
             
         Yields:
             Dict[str, Any]: Stream chunks with explanation content
         """
+        if use_cache:
+            cached = self.lookup_cached(code, mode)
+            if cached:
+                yield from self.stream_result(cached)
+                return
+
+        # Generators outlive any 'with' block around their caller, so this span is ended explicitly
+        span = self.tracer.start_span("ollama.generate", kind=tracing.KIND_CLIENT)
+        mode_alias = "review" if mode == "senior" else mode
+        # Clients assemble the text from deltas; keep parts only for the final 'done'
+        parts = []
+        generating = finished = False
         try:
             # Get the mode prompt from config
-            from backend.config import MODE_PROMPTS
-            mode_alias = "review" if mode == "senior" else mode
             mode_prompt = MODE_PROMPTS.get(mode_alias, MODE_PROMPTS["friend"])
             prompt = self.create_prompt(code, mode_prompt)
             
@@ -199,14 +391,9 @@ You're doing such a great job learning to code! 🌟"""
                 "model": self.model_name,
                 "prompt": prompt,
                 "stream": True,  # Enable streaming
-                "options": {
-                    "temperature": Config.TEMPERATURE,
-                    "top_p": Config.TOP_P,
-                    "num_predict": max(64, Config.MAX_TOKENS),  # Keep chunks small on low-RAM
-                    "num_ctx": getattr(Config, 'OLLAMA_NUM_CTX', 2048),
-                    "num_gpu": getattr(Config, 'OLLAMA_NUM_GPU', 0)
-                }
+                "options": dict(self._options, num_predict=self.budgets.num_predict(mode_alias))
             }
+            self._add_stop_sequences(payload, mode_alias)
             
             logger.info(f"Starting streaming request to Ollama with mode: {mode}")
             
@@ -214,66 +401,115 @@ You're doing such a great job learning to code! 🌟"""
             if self.keep_alive:
                 payload['keep_alive'] = self.keep_alive
             # Use (connect_timeout, read_timeout) to allow very long model generation
-            stream_timeout = getattr(Config, 'STREAM_TIMEOUT', 600)
-            response = self.session.post(self.url, json=payload, timeout=(10, stream_timeout), stream=True)
+            stream_timeout = read_timeout or getattr(Config, 'STREAM_TIMEOUT', 600)
+            if cancel is not None:
+                # Until the response exists there is nothing to close, so the deadline bounds the wait
+                stream_timeout = cancel.time_left(stream_timeout)
+            span.set_attributes(self._span_attributes(mode_alias, payload))
+            generating = True
+            response = self.session.post(self.url, json=payload, timeout=(10, stream_timeout), stream=True,
+                                         headers=tracing.inject({}, span))
+            span.set_attribute("http.status_code", response.status_code)
+            generating = response.status_code == 200
+            if cancel is not None:
+                # Closing the response from another thread unblocks iter_lines
+                cancel.on_cancel(response.close)
             
             if response.status_code == 200:
-                accumulated_text = ""
+                tracker = StructureTracker(mode_alias) if Config.STRUCTURAL_EARLY_STOP else None
+                # Text not yet sent: the tracker judges each chunk before it goes out,
+                # and a possibly unrequested heading line waits until it is complete
+                pending = ""
+                first_token_ns = None
                 try:
                     for line in response.iter_lines():
+                        if cancel is not None and cancel.cancelled:
+                            break
                         if line:
                             try:
-                                chunk_data = json.loads(line.decode('utf-8'))
+                                chunk_data = serialization.loads(line)  # decode straight from bytes
                                 if 'response' in chunk_data:
                                     text_chunk = chunk_data['response']
-                                    accumulated_text += text_chunk
+                                    parts.append(text_chunk)
+                                    pending += text_chunk
+                                    if first_token_ns is None:
+                                        # Time to first token is queueing inside Ollama plus prompt prefill
+                                        first_token_ns = time.time_ns()
+                                        if span.recording:
+                                            self.tracer.record_span("ollama.prefill", span, span.start_ns, first_token_ns)
                                     
-                                    yield {
-                                        "type": "chunk",
-                                        "content": text_chunk,
-                                        "accumulated": accumulated_text
-                                    }
+                                    # Requested structure is complete; leaving the loop closes
+                                    # the upstream response and Ollama stops generating
+                                    if tracker is not None and tracker.feed(text_chunk):
+                                        finished = True
+                                        logger.info(f"Stopping {mode_alias} stream early: {tracker.stop_reason}")
+                                        self.metrics.incr('early_stops')
+                                        span.set_attribute("generation.early_stop", tracker.stop_reason)
+                                        self.budgets.observe(mode_alias, len(parts), truncated=False, early_stop=True)
+                                        full_text = "".join(parts)
+                                        sent = len(full_text) - len(pending)
+                                        full_text = full_text[:tracker.end].rstrip()
+                                        if len(full_text) > sent:
+                                            yield {"type": "chunk", "content": full_text[sent:]}
+                                        yield self._finish_stream(code, mode, full_text)
+                                        break
                                     
-                                    # Check if this is the final chunk
-                                    if chunk_data.get('done', False):
+                                    done = chunk_data.get('done', False)
+                                    if tracker is not None and tracker.holding and not done:
+                                        cut = pending.rfind("\n") + 1
+                                    else:
+                                        cut = len(pending)
+                                    if cut:
                                         yield {
-                                            "type": "done",
-                                            "full_text": accumulated_text,
-                                            "model": self.model_name
+                                            "type": "chunk",
+                                            "content": pending[:cut]
                                         }
+                                        pending = pending[cut:]
+                                    
+                                    # Check if this is the final chunk
+                                    if done:
+                                        finished = True
+                                        self._observe_generation(mode_alias, chunk_data, fallback_tokens=len(parts))
+                                        self._trace_generation(span, chunk_data, phases=False)
+                                        yield self._finish_stream(code, mode, "".join(parts))
                                         break
                                 elif chunk_data.get('done', False):
                                     # Model signaled done without a 'response'
-                                    yield {
-                                        "type": "done",
-                                        "full_text": accumulated_text,
-                                        "model": self.model_name
-                                    }
+                                    finished = True
+                                    if pending:
+                                        yield {"type": "chunk", "content": pending}
+                                        pending = ""
+                                    self._observe_generation(mode_alias, chunk_data, fallback_tokens=len(parts))
+                                    self._trace_generation(span, chunk_data, phases=False)
+                                    yield self._finish_stream(code, mode, "".join(parts))
                                     break
-                            except json.JSONDecodeError:
+                            except serialization.DecodeError:
                                 continue
                 finally:
                     try:
                         response.close()
                     except Exception:
                         pass
+                    if first_token_ns is not None and span.recording:
+                        self.tracer.record_span("ollama.decode", span, first_token_ns, time.time_ns(),
+                                                {"ollama.chunks": len(parts)})
             else:
                 # Fallback to smart analysis if Ollama fails
                 logger.warning(f"Ollama streaming failed, will wait before using smart fallback if configured")
-                self._delay_before_fallback()
+                if cancel is not None:
+                    # Nothing is generating any more; only the client can abort the fallback
+                    cancel.clear_deadline()
+                self._delay_before_fallback(cancel)
+                if cancel is not None and cancel.cancelled:
+                    return
                 fallback_result = self._get_fallback_explanation(code, mode)
                 
                 # Stream the fallback response word by word for smooth effect
                 explanation = fallback_result["explanation"]
-                words = explanation.split()
-                accumulated = ""
-                
-                for i, word in enumerate(words):
-                    accumulated += word + " "
+                for word in self._split_words(explanation):
                     yield {
                         "type": "chunk",
-                        "content": word + " ",
-                        "accumulated": accumulated.strip()
+                        "content": word
                     }
                 
                 yield {
@@ -283,20 +519,27 @@ You're doing such a great job learning to code! 🌟"""
                 }
                 
         except Exception as e:
+            if cancel is not None and cancel.expired:
+                # The read timed out at the deadline, possibly just before the deadline watcher fired
+                cancel.cancel('deadline')
+            if cancel is not None and cancel.cancelled:
+                logger.info(f"Streaming explanation cancelled with mode: {mode} ({cancel.reason})")
+                return
             logger.error(f"Error in streaming explanation: {str(e)}")
+            span.set_error(f"{type(e).__name__}: {e}")
             # Fallback streaming on error — respect delay if configured
-            self._delay_before_fallback()
+            generating = False
+            if cancel is not None:
+                cancel.clear_deadline()
+            self._delay_before_fallback(cancel)
+            if cancel is not None and cancel.cancelled:
+                return
             fallback_result = self._get_fallback_explanation(code, mode)
             explanation = fallback_result["explanation"]
-            words = explanation.split()
-            accumulated = ""
-            
-            for word in words:
-                accumulated += word + " "
+            for word in self._split_words(explanation):
                 yield {
-                    "type": "chunk", 
-                    "content": word + " ",
-                    "accumulated": accumulated.strip()
+                    "type": "chunk",
+                    "content": word
                 }
             
             yield {
@@ -304,7 +547,79 @@ You're doing such a great job learning to code! 🌟"""
                 "full_text": explanation,
                 "model": "smart-fallback"
             }
+        finally:
+            if cancel is not None and cancel.cancelled and generating and not finished:
+                span.set_attribute("generation.cancelled", cancel.reason)
+                self._record_cancel(mode_alias, len(parts), cancel.reason)
+            span.end()
     
+    def _finish_stream(self, code: str, mode: str, full_text: str) -> Dict[str, Any]:
+        """Cache a completed model stream and build its 'done' event"""
+        self._remember(code, mode, full_text)
+        return {
+            "type": "done",
+            "full_text": full_text,
+            "model": self.model_name
+        }
+
+    @staticmethod
+    def _span_attributes(mode_alias: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "ollama.model": payload["model"],
+            "ollama.mode": mode_alias,
+            "ollama.stream": payload["stream"],
+            "ollama.num_predict": payload["options"]["num_predict"],
+            "ollama.prompt_chars": len(payload["prompt"]),
+        }
+
+    def _trace_generation(self, span, result: Dict[str, Any], phases: bool = True):
+        """
+        Token counts from Ollama's final message on the generate span
+
+        Non-stream calls also get load/prefill/decode child spans rebuilt from
+        Ollama's reported durations (streams measure time to first token instead).
+        """
+        if not span.recording:
+            return
+        for attribute, field in (("ollama.prompt_tokens", "prompt_eval_count"),
+                                 ("ollama.completion_tokens", "eval_count"),
+                                 ("ollama.done_reason", "done_reason")):
+            if result.get(field) is not None:
+                span.set_attribute(attribute, result[field])
+        if not phases:
+            return
+        loaded = span.start_ns + int(result.get('load_duration') or 0)
+        prefilled = loaded + int(result.get('prompt_eval_duration') or 0)
+        self.tracer.record_span("ollama.load", span, span.start_ns, loaded)
+        self.tracer.record_span("ollama.prefill", span, loaded, prefilled)
+        self.tracer.record_span("ollama.decode", span, prefilled, prefilled + int(result.get('eval_duration') or 0))
+
+    @staticmethod
+    def _add_stop_sequences(payload: Dict[str, Any], mode_alias: str):
+        stop = MODE_STOP_SEQUENCES.get(mode_alias)
+        if stop:
+            payload["options"]["stop"] = list(stop)
+
+    def _record_cancel(self, mode_alias: str, tokens: int, reason: str):
+        """Count a generation stopped before Ollama finished it, and the budget it did not spend"""
+        logger.info(f"Cancelled {mode_alias} generation after {tokens} tokens ({reason})")
+        self.metrics.incr('cancelled_generations')
+        self.metrics.incr(f'cancelled_{reason}')
+        self.metrics.incr('cancel_tokens_saved', self.budgets.cancelled(mode_alias, tokens))
+
+    def _observe_generation(self, mode_alias: str, result: Dict[str, Any], fallback_tokens: int):
+        """Feed a finished Ollama generation into the mode's token budget"""
+        tokens = result.get('eval_count') or fallback_tokens
+        truncated = result.get('done_reason') == 'length'
+        self.budgets.observe(mode_alias, int(tokens), truncated)
+        if truncated:
+            self.metrics.incr('truncated_generations')
+
+    @staticmethod
+    def _split_words(text: str):
+        """Split into word chunks that keep their trailing whitespace, so line breaks survive streaming"""
+        return _WORD_CHUNK.findall(text)
+
     def _detect_language(self, code: str) -> str:
         """Simple language detection based on code content"""
         code_lower = code.lower()
@@ -460,7 +775,7 @@ You're doing such a great job learning to code! 🌟"""
         
         return "\n".join(explanation) if explanation else "This is a wonderful piece of code! You're learning to speak computer language! 🤖"
         
-    def _delay_before_fallback(self):
+    def _delay_before_fallback(self, cancel: Optional[CancelToken] = None):
         """Optionally wait before switching to fallback, to allow slow models to finish"""
         try:
             delay = int(getattr(Config, 'FALLBACK_DELAY_SECONDS', 0) or 0)
@@ -471,7 +786,10 @@ You're doing such a great job learning to code! 🌟"""
             wait_seconds = min(delay, 3600)
             logger.info(f"Waiting {wait_seconds}s before using fallback (configured)")
             try:
-                time.sleep(wait_seconds)
+                if cancel is not None:
+                    cancel.wait(wait_seconds)
+                else:
+                    time.sleep(wait_seconds)
             except Exception:
                 pass
 
@@ -0,0 +1,130 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class InMemoryBucketBackend:
+    """
+    Token buckets kept in this process
+
+    Any object with the same ``take`` signature can be plugged in instead
+    (for example a store shared between worker processes). Buckets that
+    have refilled completely are dropped every ``sweep_interval`` seconds;
+    a missing bucket starts full, so this changes nothing but memory.
+    """
+
+    def __init__(self, sweep_interval: float = 60.0):
+        self._buckets: Dict[str, Tuple[float, float, float, float]] = {}  # key -> (tokens, last refill, rate, capacity)
+        self._lock = threading.Lock()
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.monotonic()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0,
+             now: Optional[float] = None) -> Tuple[bool, float]:
+        """
+        Try to remove ``cost`` tokens from the bucket for ``key``
+
+        Returns:
+            Tuple[bool, float]: (allowed, seconds until enough tokens are available)
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._last_sweep >= self.sweep_interval:
+                self._sweep(now)
+            tokens, last = self._buckets.get(key, (capacity, now))[:2]
+            tokens = min(capacity, tokens + (now - last) * rate)
+            if tokens >= cost:
+                self._buckets[key] = (tokens - cost, now, rate, capacity)
+                return True, 0.0
+            self._buckets[key] = (tokens, now, rate, capacity)
+            retry_after = (cost - tokens) / rate if rate > 0 else float('inf')
+            return False, retry_after
+
+    def _sweep(self, now: float):
+        # Lock held
+        self._last_sweep = now
+        full = [key for key, (tokens, last, rate, capacity) in self._buckets.items()
+                if tokens + (now - last) * rate >= capacity]
+        for key in full:
+            del self._buckets[key]
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+def load_backend(spec: Optional[str]):
+    """
+    Build a bucket backend from a config string
+
+    ``memory`` (or empty) gives the in-process backend, ``shared`` the
+    SQLite store shared by pre-fork workers; anything else is a
+    ``module:ClassName`` path to a class constructed without arguments.
+    """
+    if not spec or spec == 'memory':
+        return InMemoryBucketBackend()
+    if spec == 'shared':
+        spec = 'backend.services.shared_state:SharedBucketBackend'
+    module_name, _, class_name = spec.partition(':')
+    try:
+        backend_cls = getattr(importlib.import_module(module_name), class_name)
+        return backend_cls()
+    except Exception as e:
+        logger.error(f"Could not load rate limit backend '{spec}': {str(e)}; using in-memory buckets")
+        return InMemoryBucketBackend()
+
+
+class RateLimiter:
+    """
+    Per-client token bucket rate limiting with usage counters
+
+    Usage counters of clients not seen for ``idle_ttl`` seconds are dropped.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: float, backend=None, idle_ttl: float = 3600.0):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, float(burst))
+        self.backend = backend or InMemoryBucketBackend()
+        self.idle_ttl = idle_ttl
+        self._usage: Dict[str, Dict[str, float]] = {}
+        self._seen: Dict[str, float] = {}
+        self._last_sweep = time.monotonic()
+        self._usage_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def check(self, client_id: str, cost: float = 1.0) -> Tuple[bool, float]:
+        """Consume quota for one request; returns (allowed, retry_after_seconds)"""
+        if not self.enabled:
+            allowed, retry_after = True, 0.0
+        else:
+            allowed, retry_after = self.backend.take(client_id, self.rate, self.capacity, cost)
+        self.record(client_id, 'requests')
+        if not allowed:
+            self.record(client_id, 'throttled')
+        return allowed, retry_after
+
+    def record(self, client_id: str, counter: str, amount: float = 1):
+        """Add to a per-client usage counter"""
+        now = time.monotonic()
+        with self._usage_lock:
+            usage = self._usage.setdefault(client_id, {})
+            usage[counter] = usage.get(counter, 0) + amount
+            self._seen[client_id] = now
+            if self.idle_ttl > 0 and now - self._last_sweep >= min(60.0, self.idle_ttl):
+                self._last_sweep = now
+                for idle in [key for key, seen in self._seen.items() if now - seen >= self.idle_ttl]:
+                    del self._seen[idle]
+                    self._usage.pop(idle, None)
+
+    def usage(self, client_id: Optional[str] = None) -> Dict[str, Any]:
+        """Usage counters for one client, or for every client"""
+        with self._usage_lock:
+            if client_id is not None:
+                return dict(self._usage.get(client_id, {}))
+            return {key: dict(value) for key, value in self._usage.items()}
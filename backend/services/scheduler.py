@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Deque
+
+from backend import tracing
+from backend.services.cancellation import CancelToken, Cancelled
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a request waits too long for a generation slot"""
+
+
+class _Waiter:
+    __slots__ = ('cost', 'granted')
+
+    def __init__(self, cost: float):
+        self.cost = cost
+        self.granted = False
+
+
+class FairScheduler:
+    """
+    Deficit round-robin over clients for a fixed number of generation slots
+
+    Each client has its own FIFO of waiting requests. When a slot frees up,
+    clients are visited in rotation and each earns ``quantum`` credit per
+    visit, so a client that bursts many requests only gets its share of
+    slots instead of starving everyone queued behind it.
+    """
+
+    def __init__(self, slots: int, quantum: float = 1.0):
+        self.slots = max(1, int(slots))
+        self.quantum = max(0.01, float(quantum))
+        self._free = self.slots
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._deficit: Dict[str, float] = {}
+        self._ring: Deque[str] = deque()
+
+    @contextmanager
+    def slot(self, client_id: str, cost: float = 1.0, timeout: Optional[float] = None,
+             cancel: Optional[CancelToken] = None):
+        """
+        Block until this client is granted a slot, hold it for the ``with`` body
+
+        Raises SchedulerTimeout after ``timeout`` seconds, or Cancelled as
+        soon as ``cancel`` is cancelled while still waiting.
+        """
+        waiter = _Waiter(max(0.01, float(cost)))
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if cancel is not None:
+            cancel.on_cancel(self._wake)
+        with tracing.get_tracer().span("scheduler.wait") as span, self._cond:
+            queue = self._queues.get(client_id)
+            if queue is None:
+                queue = self._queues[client_id] = deque()
+                self._deficit[client_id] = 0.0
+                self._ring.append(client_id)
+            queue.append(waiter)
+            span.set_attribute("scheduler.client_queue", len(queue))
+            self._dispatch()
+            while not waiter.granted:
+                if cancel is not None and cancel.cancelled:
+                    self._withdraw(client_id, waiter)
+                    span.set_attribute("scheduler.cancelled", cancel.reason)
+                    raise Cancelled(cancel.reason)
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    self._withdraw(client_id, waiter)
+                    raise SchedulerTimeout(f"No generation slot within {timeout}s")
+                self._cond.wait(remaining)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free += 1
+                self._dispatch()
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _withdraw(self, client_id: str, waiter: _Waiter):
+        queue = self._queues.get(client_id)
+        if queue is None:
+            return
+        try:
+            queue.remove(waiter)
+        except ValueError:
+            return
+        if not queue:
+            self._drop_client(client_id)
+
+    def _drop_client(self, client_id: str):
+        self._queues.pop(client_id, None)
+        self._deficit.pop(client_id, None)
+        try:
+            self._ring.remove(client_id)
+        except ValueError:
+            pass
+
+    def _dispatch(self):
+        """Grant free slots to waiting clients in deficit round-robin order (lock held)"""
+        granted = False
+        while self._free > 0 and self._ring:
+            client_id = self._ring[0]
+            queue = self._queues[client_id]
+            head = queue[0]
+            if self._deficit[client_id] < head.cost:
+                self._deficit[client_id] += self.quantum
+                self._ring.rotate(-1)
+                continue
+            self._deficit[client_id] -= head.cost
+            queue.popleft()
+            head.granted = True
+            self._free -= 1
+            granted = True
+            if not queue:
+                self._drop_client(client_id)
+            elif self._deficit[client_id] < queue[0].cost:
+                self._ring.rotate(-1)
+        if granted:
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "busy": self.slots - self._free,
+                "waiting": sum(len(q) for q in self._queues.values()),
+                "waiting_clients": len(self._queues),
+            }
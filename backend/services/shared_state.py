@@ -0,0 +1,201 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_last_access ON cache (last_access);
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Re-stamping last_access on every read would turn cache hits into writes;
+# entries are only touched again once their stamp is this old
+_TOUCH_INTERVAL = 30.0
+
+
+class SharedStateStore:
+    """
+    Cross-process state for pre-fork deployments, kept in a local SQLite WAL database
+
+    Holds the explanation cache, rate-limit token buckets and metric
+    counters so every worker sees the same values. WAL mode lets readers
+    run concurrently with the single writer; read-modify-write operations
+    (bucket refills, counter increments) run in ``BEGIN IMMEDIATE``
+    transactions so they are atomic across processes. Connections are
+    opened per process and thread, which keeps the store fork-safe.
+    Buckets that have refilled completely are deleted every
+    ``bucket_sweep_interval`` seconds (per process), since a missing
+    bucket starts full anyway.
+    """
+
+    def __init__(self, path: str, cache_max_entries: int = 1024, busy_timeout: float = 5.0,
+                 bucket_sweep_interval: float = 60.0):
+        self.path = path
+        self.cache_max_entries = max(1, cache_max_entries)
+        self.busy_timeout = busy_timeout
+        self.bucket_sweep_interval = bucket_sweep_interval
+        self._last_sweep = time.time()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, func):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    # Explanation cache
+
+    def cache_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        row = self._connect().execute(
+            "SELECT value, expires_at, last_access FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at, last_access = row
+        if expires_at < now:
+            self._write(lambda conn: conn.execute("DELETE FROM cache WHERE key = ? AND expires_at < ?", (key, now)))
+            return None
+        if now - last_access > _TOUCH_INTERVAL:
+            self._write(lambda conn: conn.execute("UPDATE cache SET last_access = ? WHERE key = ?", (now, key)))
+        return value
+
+    def cache_put(self, key: str, value: str, ttl: float):
+        now = time.time()
+
+        def put(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            # Evict expired entries, then the least recently used beyond capacity
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+            if count > self.cache_max_entries:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY last_access LIMIT ?)",
+                    (count - self.cache_max_entries,)
+                )
+
+        self._write(put)
+
+    def cache_size(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    # Token buckets
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0,
+             now: Optional[float] = None) -> Tuple[bool, float]:
+        """Atomic token bucket take shared by every worker (same contract as InMemoryBucketBackend)"""
+        now = time.time() if now is None else now
+        sweep = now - self._last_sweep >= self.bucket_sweep_interval
+        if sweep:
+            self._last_sweep = now
+
+        def take(conn):
+            if sweep:
+                conn.execute(
+                    "DELETE FROM buckets WHERE tokens + MAX(0, ? - updated_at) * ? >= ?",
+                    (now, rate, capacity)
+                )
+            row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, last = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - last) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                (key, tokens, now)
+            )
+            if allowed:
+                return True, 0.0
+            return False, (cost - tokens) / rate if rate > 0 else float('inf')
+
+        return self._write(take)
+
+    def bucket_count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+    # Metric counters
+
+    def add_counters(self, deltas: Dict[str, float]):
+        if not deltas:
+            return
+        self._write(lambda conn: conn.executemany(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            list(deltas.items())
+        ))
+
+    def counters(self) -> Dict[str, float]:
+        return dict(self._connect().execute("SELECT name, value FROM counters").fetchall())
+
+
+_shared_store: Optional[SharedStateStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_shared_store() -> SharedStateStore:
+    """Process-wide store at Config.SHARED_STATE_PATH (connections are still per process)"""
+    global _shared_store
+    if _shared_store is None:
+        from backend.config import Config
+        with _shared_lock:
+            if _shared_store is None:
+                _shared_store = SharedStateStore(
+                    Config.SHARED_STATE_PATH,
+                    cache_max_entries=Config.EXPLANATION_CACHE_SIZE
+                )
+    return _shared_store
+
+
+class SharedBucketBackend:
+    """Rate limit backend (RATE_LIMIT_BACKEND=shared) whose buckets are shared by all workers"""
+
+    def __init__(self, store: Optional[SharedStateStore] = None):
+        self.store = store or get_shared_store()
+
+    def take(self, key: str, rate: float, capacity: float, cost: float = 1.0,
+             now: Optional[float] = None) -> Tuple[bool, float]:
+        return self.store.take(key, rate, capacity, cost, now)
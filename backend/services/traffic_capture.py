@@ -0,0 +1,122 @@
+import glob
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from backend import serialization
+
+logger = logging.getLogger(__name__)
+
+
+class TrafficCapture:
+    """
+    Append-only JSONL record of explain requests for later replay
+
+    Request threads only build a small dict and put it on a bounded queue;
+    a background thread writes the lines. Files are named
+    capture-<start time>-<pid>-<n>.jsonl, rotate at ``max_bytes`` and only the
+    newest ``max_files`` are kept. Snippets are stored as the same hash the
+    explanation store uses (or verbatim with ``content='content'``), and
+    client ids are salted hashes.
+    """
+
+    def __init__(self, directory: str, content: str = 'hash', max_bytes: int = 64 * 1024 * 1024,
+                 max_files: int = 20, salt: str = '', queue_size: int = 10000):
+        self.directory = directory
+        self.content = content
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        # Without a configured salt, client ids are only stable within this process
+        self._salt = (salt or os.urandom(16).hex()).encode('utf-8')
+        self.dropped = 0
+        self._queue: 'queue.Queue[Dict[str, Any]]' = queue.Queue(queue_size)
+        self._file = None
+        self._path: Optional[str] = None
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+        threading.Thread(target=self._run, name='traffic-capture', daemon=True).start()
+
+    def client_hash(self, client_id: str) -> str:
+        return hashlib.sha256(self._salt + client_id.encode('utf-8')).hexdigest()[:16]
+
+    def request_fields(self, endpoint: str, code: str, mode: str, client_id: str) -> Dict[str, Any]:
+        """The part of an entry known when the request arrives"""
+        # Imported here so STARTUP_MODE=lazy keeps the store out of import time
+        from backend.services.explanation_store import hash_code
+        fields = {
+            "ts": time.time(),
+            "endpoint": endpoint,
+            "mode": mode,
+            "code_hash": hash_code(code),
+            "code_length": len(code),
+            "client": self.client_hash(client_id),
+        }
+        if self.content == 'content':
+            fields["code"] = code
+        return fields
+
+    def record(self, entry: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            lines = [entry]
+            while len(lines) < 512:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(b"".join(serialization.dumps_bytes(line) + b"\n" for line in lines))
+            except Exception as e:
+                logger.warning(f"Could not write {len(lines)} capture entries: {str(e)}")
+            for _ in lines:
+                self._queue.task_done()
+
+    def _write(self, data: bytes):
+        if self._file is None or self._file.tell() >= self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._sequence += 1
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        self._path = os.path.join(self.directory, f"capture-{stamp}-{os.getpid()}-{self._sequence}.jsonl")
+        self._file = open(self._path, 'ab')
+        files = sorted(glob.glob(os.path.join(self.directory, 'capture-*.jsonl')), key=os.path.getmtime)
+        for old in files[:-self.max_files] if self.max_files > 0 else []:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+    def flush(self, timeout: float = 2.0):
+        """Wait until queued entries are written (tests and shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+
+def build_capture() -> Optional[TrafficCapture]:
+    """TrafficCapture from Config, or None when CAPTURE_ENABLED is off"""
+    from backend.config import Config
+    if not Config.CAPTURE_ENABLED:
+        return None
+    return TrafficCapture(
+        Config.CAPTURE_DIR,
+        content=Config.CAPTURE_CODE,
+        max_bytes=Config.CAPTURE_MAX_BYTES,
+        max_files=Config.CAPTURE_MAX_FILES,
+        salt=Config.CAPTURE_SALT,
+    )
@@ -0,0 +1,176 @@
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from backend import serialization
+from backend.services.cancellation import CancelToken
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class StreamRejected(Exception):
+    """Raised by a stream factory to refuse an explain message with a client-facing reason"""
+
+
+class MultiplexedConnection:
+    """
+    Many concurrent explanation streams over one WebSocket
+
+    Client messages (JSON):
+        {"type": "explain", "id": "<stream id>", "code": "...", "mode": "..."}
+        {"type": "cancel", "id": "<stream id>"}
+        {"type": "ping"}
+
+    Every server event carries the stream ``id``. Each stream runs in its
+    own worker thread and all of them feed one bounded outgoing queue
+    drained by a single writer. When a client reads slowly the queue fills,
+    workers block on it and stop pulling tokens from Ollama, so memory per
+    connection stays bounded. Cancelling a stream closes its upstream
+    request.
+    """
+
+    def __init__(self, send: Callable[[str], None],
+                 open_stream: Callable[[Dict[str, Any], CancelToken], Iterator[Dict[str, Any]]],
+                 max_streams: int = 8, queue_size: int = 256):
+        self._send = send
+        self._open_stream = open_stream
+        self.max_streams = max(1, max_streams)
+        self._outgoing: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self._streams: Dict[str, CancelToken] = {}
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+
+    def serve(self, receive: Callable[[], Optional[str]]):
+        """Run the connection until the client goes away (blocks the calling thread)"""
+        writer = threading.Thread(target=self._write_loop, name="ws-writer", daemon=True)
+        writer.start()
+        try:
+            while not self._closed.is_set():
+                raw = receive()
+                if raw is None:
+                    break
+                self.handle_message(raw)
+        finally:
+            self.close()
+            writer.join(timeout=5)
+
+    def handle_message(self, raw):
+        try:
+            message = serialization.loads(raw)
+        except serialization.DecodeError:
+            self._put(None, {"type": "error", "message": "Invalid JSON message"})
+            return
+        if not isinstance(message, dict):
+            self._put(None, {"type": "error", "message": "Message must be a JSON object"})
+            return
+
+        kind = message.get("type")
+        stream_id = message.get("id")
+        if kind == "ping":
+            self._put(None, {"type": "pong"})
+        elif kind == "cancel":
+            self.cancel(str(stream_id))
+        elif kind == "explain":
+            self._start_stream(None if stream_id is None else str(stream_id), message)
+        else:
+            self._put(stream_id, {"type": "error", "message": f"Unknown message type: {kind}"})
+
+    def _start_stream(self, stream_id: Optional[str], message: Dict[str, Any]):
+        if not stream_id:
+            self._put(None, {"type": "error", "message": "Missing stream 'id'"})
+            return
+        cancel = CancelToken()
+        with self._lock:
+            if stream_id in self._streams:
+                error = "Stream id already in use"
+            elif len(self._streams) >= self.max_streams:
+                error = f"Too many concurrent streams (max {self.max_streams})"
+            else:
+                error = None
+                self._streams[stream_id] = cancel
+        if error:
+            self._put(stream_id, {"type": "error", "message": error})
+            return
+        threading.Thread(
+            target=self._run_stream, args=(stream_id, message, cancel),
+            name=f"ws-stream-{stream_id}", daemon=True
+        ).start()
+
+    def _run_stream(self, stream_id: str, message: Dict[str, Any], cancel: CancelToken):
+        events = None
+        try:
+            events = self._open_stream(message, cancel)
+            for event in events:
+                if cancel.cancelled or not self._put(stream_id, event, cancel):
+                    break
+            if cancel.cancelled:
+                self._put(stream_id, {"type": "cancelled", "reason": cancel.reason})
+        except StreamRejected as e:
+            self._put(stream_id, {"type": "error", "message": str(e)})
+        except Exception as e:
+            logger.error(f"Error in websocket stream {stream_id}: {str(e)}")
+            self._put(stream_id, {"type": "error", "message": "Internal server error"})
+        finally:
+            if events is not None and hasattr(events, 'close'):
+                # Closing the generator releases its upstream response and scheduler slot
+                events.close()
+            with self._lock:
+                self._streams.pop(stream_id, None)
+
+    def cancel(self, stream_id: str):
+        with self._lock:
+            cancel = self._streams.get(stream_id)
+        if cancel is not None:
+            cancel.cancel()
+
+    def close(self):
+        """Cancel every stream and stop the writer"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._lock:
+            tokens = list(self._streams.values())
+        for cancel in tokens:
+            cancel.cancel('disconnected')
+        # Make room for the sentinel even if the writer has died
+        while True:
+            try:
+                self._outgoing.put_nowait(_CLOSE)
+                break
+            except queue.Full:
+                try:
+                    self._outgoing.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _put(self, stream_id, event: Dict[str, Any], cancel: Optional[CancelToken] = None) -> bool:
+        """Queue an event, blocking while the client is behind (backpressure)"""
+        item = serialization.dumps(dict(event, id=stream_id))
+        while not self._closed.is_set():
+            if cancel is not None and cancel.cancelled:
+                return False
+            try:
+                self._outgoing.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _write_loop(self):
+        while True:
+            item = self._outgoing.get()
+            if item is _CLOSE:
+                return
+            try:
+                self._send(item)
+            except Exception as e:
+                logger.info(f"WebSocket send failed, closing connection: {str(e)}")
+                self.close()
+                return
+
+    def active_streams(self) -> int:
+        with self._lock:
+            return len(self._streams)
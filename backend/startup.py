@@ -0,0 +1,126 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Deferred:
+    """
+    A value built on first use, or ahead of time on a background thread
+
+    ``get()`` builds it at most once (concurrent callers wait for the same
+    build). A failed build is logged and retried on the next ``get()``.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._built = False
+        self._lock = threading.Lock()
+        self.error: Optional[str] = None
+        self.build_seconds: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._built
+
+    def get(self) -> Any:
+        if self._built:
+            return self._value
+        with self._lock:
+            if not self._built:
+                started = time.perf_counter()
+                try:
+                    self._value = self._factory()
+                except Exception as e:
+                    self.error = str(e)
+                    logger.error(f"Could not initialize {self.name}: {str(e)}")
+                    raise
+                self.build_seconds = time.perf_counter() - started
+                self.error = None
+                self._built = True
+                logger.info(f"Initialized {self.name} in {self.build_seconds * 1000:.0f} ms")
+        return self._value
+
+    def start(self) -> threading.Thread:
+        """Build in the background so the first request does not pay for it"""
+        def build():
+            try:
+                self.get()
+            except Exception:
+                pass  # logged in get(); the first request retries
+        thread = threading.Thread(target=build, name=f"init-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def state(self) -> str:
+        if self._built:
+            return "ready"
+        return "failed" if self.error else "pending"
+
+
+class LazyProxy:
+    """Forwards attribute access to a Deferred value, building it on first touch"""
+
+    __slots__ = ('_deferred',)
+
+    def __init__(self, deferred: Deferred):
+        object.__setattr__(self, '_deferred', deferred)
+
+    def __getattr__(self, name: str):
+        return getattr(self._deferred.get(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self._deferred.get(), name, value)
+
+
+class ReadinessProbe:
+    """
+    Periodic background check that the app can serve explanations
+
+    ``check`` is called off the request path every ``interval`` seconds
+    (every ``retry_interval`` while failing), so /ready answers from the
+    last result instead of blocking on Ollama.
+    """
+
+    def __init__(self, check: Callable[[], bool], interval: float = 30.0, retry_interval: float = 2.0):
+        self._check = check
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.ready: Optional[bool] = None  # None until the first check finishes
+        self.checked_at: Optional[float] = None
+        self._started = False
+        self._lock = threading.Lock()
+        self._first = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._run, name="readiness-probe", daemon=True).start()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[bool]:
+        """Block until the first check has finished (used by the dev server banner)"""
+        self._first.wait(timeout)
+        return self.ready
+
+    def _run(self):
+        while True:
+            try:
+                ready = bool(self._check())
+            except Exception as e:
+                logger.warning(f"Readiness check failed: {str(e)}")
+                ready = False
+            if ready != self.ready:
+                logger.info(f"Readiness changed: {'ready' if ready else 'not ready'}")
+            self.ready = ready
+            self.checked_at = time.time()
+            self._first.set()
+            time.sleep(self.interval if ready else self.retry_interval)
+
+    def status(self) -> Dict[str, Any]:
+        return {"ready": bool(self.ready), "checked": self.ready is not None, "checked_at": self.checked_at}
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from typing import Dict, Optional
+
+from flask import Response, request
+
+from backend.compression import choose_encoding, compress_all
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE = 'no-cache'
+
+
+class Asset:
+    """One frontend file (or fixed API body) held in memory with its precompressed variants"""
+
+    def __init__(self, name: str, body: bytes, fingerprinted: Optional[str] = None):
+        self.name = name
+        self.body = body
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+        self.fingerprinted = fingerprinted
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.mimetype.startswith('text/') or self.mimetype in ('application/javascript', 'application/json',
+                                                                  'image/svg+xml'):
+            self.variants = compress_all(body)
+        else:
+            self.variants = {}
+
+    def etag(self, encoding: Optional[str]) -> str:
+        # Strong ETags must differ per content-coding
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def response(self, cache_control: str = REVALIDATE_CACHE) -> Response:
+        """Negotiated (precompressed) response for the current request, or 304 when the ETag matches"""
+        encoding = choose_encoding(request.accept_encodings, self.variants)
+        etag = self.etag(encoding)
+        headers = {'ETag': etag, 'Cache-Control': cache_control}
+        if self.variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if request.if_none_match.contains_raw(etag) or request.if_none_match.star_tag:
+            return Response(status=304, headers=headers)
+
+        body = self.variants[encoding] if encoding else self.body
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(body, mimetype=self.mimetype, headers=headers)
+
+
+class StaticAssets:
+    """
+    Build-free asset pipeline for the frontend directory
+
+    At startup every file is read once, hashed and precompressed (gzip, and
+    brotli when installed). CSS/JS are also published under content-hashed
+    names (``script.<hash>.js``) with immutable cache headers, and
+    ``index.html`` is rewritten to reference them. Everything is served from
+    memory with ETag/304 support.
+    """
+
+    FINGERPRINT_EXTENSIONS = ('.css', '.js')
+
+    def __init__(self, directory: str, index: str = 'index.html'):
+        self.directory = directory
+        self.index = index
+        self._assets: Dict[str, Asset] = {}
+        self.load()
+
+    def load(self):
+        assets: Dict[str, Asset] = {}
+        renames: Dict[str, str] = {}
+        index_body = None
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    body = f.read()
+                if name == self.index:
+                    index_body = body
+                    continue
+                fingerprinted = None
+                stem, ext = os.path.splitext(name)
+                if ext in self.FINGERPRINT_EXTENSIONS:
+                    fingerprinted = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+                    renames[name] = fingerprinted
+                asset = Asset(name, body, fingerprinted)
+                assets[name] = asset
+                if fingerprinted:
+                    assets[fingerprinted] = asset
+
+        if index_body is not None:
+            assets[self.index] = Asset(self.index, self._rewrite_index(index_body, renames))
+
+        self._assets = assets
+        logger.info(f"Loaded {len(renames)} fingerprinted assets from {self.directory}")
+
+    @staticmethod
+    def _rewrite_index(body: bytes, renames: Dict[str, str]) -> bytes:
+        if not renames:
+            return body
+        html = body.decode('utf-8')
+        pattern = re.compile(r'((?:href|src)=["\'])(%s)(["\'])' % '|'.join(re.escape(n) for n in renames))
+        html = pattern.sub(lambda m: m.group(1) + renames[m.group(2)] + m.group(3), html)
+        return html.encode('utf-8')
+
+    def url_for(self, name: str) -> str:
+        """Public (fingerprinted when available) name of an asset"""
+        asset = self._assets.get(name)
+        return asset.fingerprinted if asset and asset.fingerprinted else name
+
+    def serve(self, name: str) -> Optional[Response]:
+        """Response for ``name``, or None if the asset is unknown"""
+        asset = self._assets.get(name)
+        if asset is None:
+            return None
+
+        immutable = asset.fingerprinted is not None and name == asset.fingerprinted
+        return asset.response(IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE)
@@ -0,0 +1,551 @@
+import abc
+import contextvars
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from backend import serialization
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+_current: contextvars.ContextVar = contextvars.ContextVar('codewhisper_span', default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+def request_id_from(header: Optional[str]) -> str:
+    """Use a caller-supplied request id when it is sane, otherwise make one"""
+    if header and _REQUEST_ID.match(header):
+        return header
+    return _new_id(16)
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace_id, parent_span_id, sampled) from a W3C traceparent header, or None"""
+    if not header:
+        return None
+    match = _TRACEPARENT.match(header.strip().lower())
+    if not match or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class _Trace:
+    """Finished spans of one trace in this process, held until the local root ends"""
+
+    __slots__ = ('spans', 'exported', 'force')
+
+    def __init__(self, force: bool):
+        self.spans: List['Span'] = []
+        self.exported = False
+        self.force = force  # head-sampled: export regardless of duration
+
+
+class Span:
+    """
+    One timed operation, exported in OTLP/JSON form
+
+    Use as a context manager (``with tracer.span(...)``) or call ``end()``.
+    Exceptions leaving the ``with`` block mark the span as failed.
+    """
+
+    recording = True
+
+    __slots__ = ('tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_id', 'request_id',
+                 'start_ns', 'end_ns', 'attributes', 'events', 'status', '_trace', '_local_root')
+
+    def __init__(self, tracer: 'Tracer', name: str, trace_id: str, parent_id: Optional[str],
+                 request_id: Optional[str], trace: _Trace, local_root: bool, kind: int = KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.request_id = request_id
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = dict(attributes) if attributes else {}
+        self.events: List[tuple] = []
+        self.status: Optional[str] = None
+        self._trace = trace
+        self._local_root = local_root
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        self.attributes.update(attributes)
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        self.events.append((time.time_ns(), name, attributes or {}))
+
+    def set_error(self, message: str):
+        self.status = message
+
+    def end(self, end_ns: Optional[int] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns or time.time_ns()
+        self.tracer._finish(self)
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None and not isinstance(exc, GeneratorExit):
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        self.end()
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.events:
+            span["events"] = [
+                {"timeUnixNano": str(ts), "name": name, "attributes": _otlp_attributes(attrs)}
+                for ts, name, attrs in self.events
+            ]
+        if self.status:
+            span["status"] = {"code": STATUS_ERROR, "message": self.status}
+        return span
+
+
+class NonRecordingSpan:
+    """
+    Stand-in for unsampled requests
+
+    Carries the ids needed to propagate the trace upstream but records
+    nothing; children of a non-recording span are the span itself, so an
+    unsampled request allocates one object in total.
+    """
+
+    recording = False
+
+    __slots__ = ('trace_id', 'span_id', 'request_id')
+
+    def __init__(self, trace_id: str, span_id: str, request_id: Optional[str]):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.request_id = request_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-00"
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Dict[str, Any]):
+        pass
+
+    def add_event(self, name: str, attributes: Optional[Dict[str, Any]] = None):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def end(self, end_ns: Optional[int] = None):
+        pass
+
+    def __enter__(self) -> 'NonRecordingSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items()]
+
+
+class Tracer:
+    """
+    Creates spans and decides which traces are exported
+
+    A trace is recorded when the caller's traceparent says it is sampled,
+    when its trace id falls under ``sample_rate``, or, if ``slow_seconds``
+    is set, always; in that last case only traces whose root took at least
+    ``slow_seconds`` (or that were head-sampled) are exported. With no
+    exporter nothing is recorded, but request ids and traceparent headers
+    are still generated and forwarded.
+    """
+
+    def __init__(self, exporter=None, sample_rate: float = 0.0, slow_seconds: float = 0.0,
+                 service_name: str = 'codewhisper'):
+        self.exporter = exporter
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.slow_ns = int(max(0.0, slow_seconds) * 1e9)
+        self.service_name = service_name
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def _head_sampled(self, trace_id: str) -> bool:
+        # Deterministic on the trace id, so every process makes the same decision
+        return int(trace_id[-8:], 16) < self.sample_rate * 0xFFFFFFFF
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, request_id: Optional[str] = None,
+                    kind: int = KIND_SERVER, attributes: Optional[Dict[str, Any]] = None):
+        """Local root span for an incoming request, continuing the caller's trace if given"""
+        parent = parse_traceparent(traceparent)
+        if parent:
+            trace_id, parent_id, parent_sampled = parent
+        else:
+            trace_id, parent_id, parent_sampled = _new_id(16), None, False
+        head = parent_sampled or self._head_sampled(trace_id)
+        if not self.enabled or not (head or self.slow_ns):
+            return NonRecordingSpan(trace_id, _new_id(8), request_id)
+        span = Span(self, name, trace_id, parent_id, request_id, _Trace(force=head),
+                    local_root=True, kind=kind, attributes=attributes)
+        if request_id:
+            span.attributes['request.id'] = request_id
+        return span
+
+    def start_span(self, name: str, parent=None, kind: int = KIND_INTERNAL,
+                   attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None):
+        """Child of ``parent`` (default: the active span); a new root if there is none"""
+        if parent is None:
+            parent = _current.get()
+            if parent is None:
+                return self.start_trace(name, kind=kind, attributes=attributes)
+        if not parent.recording:
+            return parent
+        return Span(self, name, parent.trace_id, parent.span_id, parent.request_id, parent._trace,
+                    local_root=False, kind=kind, attributes=attributes, start_ns=start_ns)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        """Child of the active span, itself active for the ``with`` body (not for use across yields)"""
+        span = self.start_span(name, kind=kind, attributes=attributes)
+        with span, activate(span):
+            yield span
+
+    def record_span(self, name: str, parent, start_ns: int, end_ns: int,
+                    attributes: Optional[Dict[str, Any]] = None):
+        """Add an already finished span (e.g. timings reported by Ollama)"""
+        if parent is None or not parent.recording or end_ns <= start_ns:
+            return
+        self.start_span(name, parent=parent, attributes=attributes, start_ns=start_ns).end(end_ns)
+
+    def _finish(self, span: Span):
+        trace = span._trace
+        if trace.exported:
+            # Finished after its root was exported (e.g. a late background span)
+            self.exporter.export([span])
+            return
+        trace.spans.append(span)
+        if not span._local_root:
+            return
+        if trace.force or span.end_ns - span.start_ns >= self.slow_ns:
+            trace.exported = True
+            self.exporter.export(trace.spans)
+        trace.spans = []
+
+    def shutdown(self):
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+
+def current_span():
+    """The span active in this context, or None"""
+    return _current.get()
+
+
+def attach(span) -> contextvars.Token:
+    """Make ``span`` the active span; pass the returned token to ``detach``"""
+    return _current.set(span)
+
+
+def detach(token: contextvars.Token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # A generator closed from another context; that context never saw the span
+        pass
+
+
+@contextmanager
+def activate(span) -> Iterator[Any]:
+    """Make ``span`` the parent of spans started in this context"""
+    token = attach(span)
+    try:
+        yield span
+    finally:
+        detach(token)
+
+
+def inject(headers: Dict[str, str], span=None) -> Dict[str, str]:
+    """Add traceparent and X-Request-ID for an upstream call"""
+    span = span if span is not None else _current.get()
+    if span is not None:
+        headers['traceparent'] = span.traceparent
+        if span.request_id:
+            headers['X-Request-ID'] = span.request_id
+    return headers
+
+
+class BatchExporter(abc.ABC):
+    """
+    Exports spans from a background thread in batches
+
+    Request threads only put spans on a bounded queue; when the queue is
+    full spans are dropped (and counted) rather than slowing requests down.
+    """
+
+    def __init__(self, max_queue: int = 4096, batch_size: int = 256, interval: float = 1.0,
+                 service_name: str = 'codewhisper'):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.service_name = service_name
+        self.dropped = 0
+        self._queue: 'queue.Queue[Span]' = queue.Queue(max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+        self._thread.start()
+
+    def export(self, spans: List[Span]):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            try:
+                self.write(self.encode(batch))
+            except Exception as e:
+                logger.warning(f"Could not export {len(batch)} spans: {str(e)}")
+
+    def encode(self, spans: List[Span]) -> bytes:
+        """One OTLP/JSON ExportTraceServiceRequest"""
+        return serialization.dumps_bytes({
+            "resourceSpans": [{
+                "resource": {"attributes": _otlp_attributes({
+                    "service.name": self.service_name,
+                    "process.pid": os.getpid(),
+                })},
+                "scopeSpans": [{
+                    "scope": {"name": "codewhisper"},
+                    "spans": [span.to_otlp() for span in spans],
+                }],
+            }]
+        })
+
+    @abc.abstractmethod
+    def write(self, payload: bytes):
+        """Send one encoded batch"""
+
+    def shutdown(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+        self.flush()
+
+
+class FileSpanExporter(BatchExporter):
+    """Appends one OTLP/JSON request per line (the OpenTelemetry Collector file exporter format)"""
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        super().__init__(**kwargs)
+
+    def write(self, payload: bytes):
+        with open(self.path, 'ab') as f:
+            f.write(payload + b"\n")
+
+
+class OTLPHttpExporter(BatchExporter):
+    """POSTs OTLP/JSON to a collector's /v1/traces endpoint"""
+
+    def __init__(self, endpoint: str, timeout: float = 2.0, **kwargs):
+        import requests
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.session = requests.Session()
+        super().__init__(**kwargs)
+
+    def write(self, payload: bytes):
+        response = self.session.post(self.endpoint, data=payload, timeout=self.timeout,
+                                     headers={'Content-Type': 'application/json'})
+        if response.status_code >= 300:
+            raise RuntimeError(f"collector returned {response.status_code}")
+
+
+def build_exporter(kind: str, path: str, endpoint: str):
+    """Exporter for Config.TRACING_EXPORT ('file', 'otlp'); None disables tracing"""
+    if kind == 'file':
+        return FileSpanExporter(path)
+    if kind == 'otlp':
+        return OTLPHttpExporter(endpoint)
+    if kind:
+        logger.error(f"Unknown TRACING_EXPORT '{kind}'; tracing disabled")
+    return None
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer configured from Config"""
+    global _tracer
+    if _tracer is None:
+        from backend.config import Config
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = Tracer(
+                    build_exporter(Config.TRACING_EXPORT, Config.TRACE_FILE, Config.TRACE_OTLP_ENDPOINT),
+                    sample_rate=Config.TRACE_SAMPLE_RATE,
+                    slow_seconds=Config.TRACE_SLOW_SECONDS,
+                )
+    return _tracer
+
+
+def _iter_spans(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            for resource in serialization.loads(line).get('resourceSpans', []):
+                for scope in resource.get('scopeSpans', []):
+                    yield from scope.get('spans', [])
+
+
+def _cmd_collect(args) -> int:
+    """Minimal OTLP/HTTP JSON receiver that appends to a file"""
+    import http.server
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *a):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if self.path != '/v1/traces' or 'json' not in (self.headers.get('Content-Type') or ''):
+                self.send_response(415 if self.path == '/v1/traces' else 404)
+                self.end_headers()
+                return
+            with lock, open(args.output, 'ab') as f:
+                f.write(body.strip() + b"\n")
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.end_headers()
+            self.wfile.write(b'{}')
+
+    server = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"📥 Collecting OTLP/JSON traces on http://{args.host}:{args.port}/v1/traces into {args.output}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def _cmd_show(args) -> int:
+    """Print each trace as an indented span tree with durations"""
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    for span in _iter_spans(args.path):
+        traces.setdefault(span['traceId'], []).append(span)
+    selected = list(traces.items())[-args.last:] if args.last else traces.items()
+    for trace_id, spans in selected:
+        children: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        ids = {span['spanId'] for span in spans}
+        for span in sorted(spans, key=lambda s: int(s['startTimeUnixNano'])):
+            parent = span.get('parentSpanId')
+            children.setdefault(parent if parent in ids else None, []).append(span)
+        print(f"trace {trace_id}")
+
+        def show(span, depth):
+            duration = (int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])) / 1e6
+            error = f"  ❌ {span['status'].get('message', '')}" if span.get('status') else ""
+            print(f"  {'  ' * depth}{span['name']:<{40 - 2 * depth}} {duration:10.1f} ms{error}")
+            for child in children.get(span['spanId'], []):
+                show(child, depth + 1)
+
+        for root in children.get(None, []):
+            show(root, 0)
+    return 0
+
+
+def main(argv=None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local trace collection and inspection")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('collect', help="Run a local OTLP/HTTP (JSON) collector stand-in")
+    p.add_argument('--host', default='127.0.0.1')
+    p.add_argument('--port', type=int, default=4318)
+    p.add_argument('--output', default='data/traces.jsonl')
+    p.set_defaults(func=_cmd_collect)
+
+    p = sub.add_parser('show', help="Print span trees from an exported trace file")
+    p.add_argument('path', nargs='?', default='data/traces.jsonl')
+    p.add_argument('--last', type=int, default=10, help="Only the last N traces (0 for all)")
+    p.set_defaults(func=_cmd_show)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
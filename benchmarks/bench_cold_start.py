@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Cold start: time from process start to the first served requests
+
+Each run starts a fresh interpreter that imports app and serves, through
+the Flask test client, a /modes request and then an /explain request
+(smart fallback, so Ollama is not needed). The parent measures the whole
+process; the child reports import time and each first request. Run once
+per STARTUP_MODE and compare the medians. Lazy and background modes cut
+import time; what they save there the first /explain partly pays back.
+
+Usage: python benchmarks/bench_cold_start.py [runs]
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/modes')
+first = time.perf_counter()
+client.post('/explain', json={'code': 'print("hi")', 'mode': 'friend'})
+explained = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first - imported) * 1000,
+    'first_explain_ms': (explained - first) * 1000,
+}))
+"""
+
+
+def run_once(mode: str):
+    env = dict(
+        os.environ,
+        STARTUP_MODE=mode,
+        USE_FALLBACK_FIRST='True',
+        FALLBACK_DELAY_SECONDS='0',
+        RATE_LIMIT_PER_MINUTE='0',
+        TRACING_EXPORT='',
+        OLLAMA_HOST='127.0.0.1',
+        OLLAMA_PORT='9',  # closed port: the availability probe fails fast
+    )
+    started = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    total_ms = (time.perf_counter() - started) * 1000
+    result = json.loads(output.strip().splitlines()[-1])
+    result['process_ms'] = total_ms
+    return result
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    print(f"🧪 Cold start, median of {runs} runs (ms)")
+    print("=" * 50)
+    print(f"   {'mode':<12}{'import':>9}{'/modes':>9}{'/explain':>10}{'process':>10}")
+    for mode in ('eager', 'lazy', 'background'):
+        results = [run_once(mode) for _ in range(runs)]
+
+        def median(key):
+            return statistics.median(r[key] for r in results)
+
+        print(f"   {mode:<12}{median('import_ms'):9.0f}{median('first_request_ms'):9.0f}"
+              f"{median('first_explain_ms'):10.0f}{median('process_ms'):10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for per-token JSON overhead on the streaming path
+
+Compares the original stdlib handling (decode the upstream NDJSON line to
+str, json.loads it, json.dumps the SSE event into an f-string) with the
+backend.serialization fast path.
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import serialization
+
+ITERATIONS = 200000
+
+UPSTREAM_LINE = json.dumps({
+    "model": "qwen2.5-coder:7b",
+    "created_at": "2024-01-01T00:00:00.000000Z",
+    "response": " recursion",
+    "done": False
+}).encode('utf-8')
+
+
+def stdlib_token():
+    chunk_data = json.loads(UPSTREAM_LINE.decode('utf-8'))
+    event = {"type": "chunk", "content": chunk_data['response']}
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def fast_token():
+    chunk_data = serialization.loads(UPSTREAM_LINE)
+    event = {"type": "chunk", "content": chunk_data['response']}
+    return serialization.sse_event(event)
+
+
+def stdlib_complete():
+    return f"data: {json.dumps({'type': 'complete'})}\n\n"
+
+
+def main():
+    frames = serialization.SSEFrames(["friend"], "qwen2.5-coder:7b")
+
+    print(f"🧪 Per-token JSON overhead ({ITERATIONS:,} iterations, backend: {serialization.BACKEND})")
+    print("=" * 50)
+    results = [
+        ("stdlib decode + encode", stdlib_token),
+        ("fast decode + encode", fast_token),
+        ("stdlib complete frame", stdlib_complete),
+        ("pre-encoded complete frame", lambda: frames.complete),
+    ]
+    for name, func in results:
+        seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+        print(f"   {name:<28} {seconds / ITERATIONS * 1e9:8.0f} ns/event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Explanation cache hit rate with N worker processes
+
+Each worker replays the same Zipf-like snippet popularity: a miss stands
+for a model generation and is written back to the cache. With per-process
+caches every worker has to generate each popular snippet itself; the
+shared SQLite cache lets one worker's generation serve all of them.
+
+Usage: python benchmarks/bench_shared_cache.py [workers] [requests_per_worker]
+"""
+
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.explanation_cache import ExplanationCache, SharedExplanationCache
+from backend.services.shared_state import SharedStateStore
+
+SNIPPETS = 2000
+CACHE_SIZE = 512
+ZIPF_S = 1.1
+
+
+def _requests(seed: int, count: int):
+    rng = random.Random(seed)
+    weights = [1.0 / (rank ** ZIPF_S) for rank in range(1, SNIPPETS + 1)]
+    return rng.choices(range(SNIPPETS), weights=weights, k=count)
+
+
+def _worker(args):
+    kind, path, seed, count = args
+    if kind == 'shared':
+        cache = SharedExplanationCache(SharedStateStore(path, cache_max_entries=CACHE_SIZE))
+    else:
+        cache = ExplanationCache(CACHE_SIZE)
+    hits = 0
+    started = time.perf_counter()
+    for snippet in _requests(seed, count):
+        key = f"snippet-{snippet}"
+        if cache.get(key) is not None:
+            hits += 1
+        else:
+            cache.put(key, "explanation " * 50)
+    return hits, time.perf_counter() - started
+
+
+def run(kind: str, workers: int, count: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'shared_state.db')
+        SharedStateStore(path, cache_max_entries=CACHE_SIZE)  # create schema once
+        with multiprocessing.Pool(workers) as pool:
+            results = pool.map(_worker, [(kind, path, seed, count) for seed in range(workers)])
+    hits = sum(r[0] for r in results)
+    seconds = max(r[1] for r in results)
+    total = workers * count
+    print(f"   {kind:<12} hit rate {hits / total:6.1%}   "
+          f"generations {total - hits:6d}   {total / seconds:8.0f} lookups/s")
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"🧪 Explanation cache hit rate ({workers} workers x {count} requests, {SNIPPETS} snippets)")
+    print("=" * 50)
+    run('per-process', workers, count)
+    run('shared', workers, count)
+
+
+if __name__ == "__main__":
+    main()
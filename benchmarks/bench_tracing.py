@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tracing overhead per request at different sample rates
+
+Builds the span tree of one streamed explanation (root, parse, rate
+limit, cache lookup, queue wait, generate with prefill/decode) and times
+it with tracing off, head sampling at a few rates, and slow-trace
+capture. Spans go to a null exporter so only the in-request cost is
+measured; exporting happens on a background thread in production.
+
+Usage: python benchmarks/bench_tracing.py [iterations]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import tracing
+
+# A fast cached /explain answer is a few milliseconds end to end
+REFERENCE_REQUEST_MS = 5.0
+
+
+class NullExporter:
+    def export(self, spans):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+def one_request(tracer: tracing.Tracer):
+    root = tracer.start_trace("POST /explain-stream", request_id=tracing.request_id_from(None),
+                              attributes={"http.method": "POST", "http.route": "/explain-stream"})
+    token = tracing.attach(root)
+    try:
+        for name in ("parse_request", "rate_limit", "cache.lookup", "scheduler.wait"):
+            with tracer.span(name) as span:
+                span.set_attribute("example", 1)
+        generate = tracer.start_span("ollama.generate", kind=tracing.KIND_CLIENT)
+        tracing.inject({}, generate)
+        now = time.time_ns()
+        tracer.record_span("ollama.prefill", generate, now - 2000, now - 1000)
+        tracer.record_span("ollama.decode", generate, now - 1000, now)
+        generate.end()
+    finally:
+        tracing.detach(token)
+    root.end()
+
+
+def run(label: str, tracer, iterations: int):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        one_request(tracer)
+    per_request_us = (time.perf_counter() - started) / iterations * 1e6
+    overhead = per_request_us / (REFERENCE_REQUEST_MS * 1000)
+    print(f"   {label:<24} {per_request_us:8.1f} µs/request   {overhead:6.2%} of a {REFERENCE_REQUEST_MS:.0f} ms request")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"🧪 Tracing overhead ({iterations} requests, 8 spans each)")
+    print("=" * 50)
+    run("disabled", tracing.Tracer(None), iterations)
+    for rate in (0.01, 0.05, 1.0):
+        run(f"sample rate {rate:g}", tracing.Tracer(NullExporter(), sample_rate=rate), iterations)
+    run("slow capture (record all)", tracing.Tracer(NullExporter(), sample_rate=0.0, slow_seconds=1.0), iterations)
+
+
+if __name__ == "__main__":
+    main()
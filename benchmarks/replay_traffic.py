@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Replay captured explain traffic against the app with a stub Ollama
+
+Reads capture files written with CAPTURE_ENABLED=True (or any JSONL with
+'code'/'code_hash' and 'mode'). It serves the app in-process against a
+deterministic stub Ollama and re-sends every request at its original
+arrival offset, divided by --speed. Use --speed 0 to send as fast as
+--concurrency allows. Hash-only captures get a synthetic snippet per
+hash, so repeats still hit the cache. Reports latency percentiles,
+cache hit rate and fallback rate, so caching, scheduling and routing
+changes can be compared on the same traffic shape:
+
+    python benchmarks/replay_traffic.py data/capture/*.jsonl --speed 4
+    python benchmarks/replay_traffic.py data/capture/*.jsonl --env EXPLANATION_CACHE_SIZE=0
+
+Usage: python benchmarks/replay_traffic.py CAPTURE [CAPTURE ...] [options]
+"""
+
+import argparse
+import glob
+import hashlib
+import http.server
+import json
+import os
+import random
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ("the function loops over input values and returns a result while checking "
+         "edge cases such as empty lists negative numbers and large inputs").split()
+
+
+class StubOllama:
+    """
+    Deterministic stand-in for Ollama's /api/generate and /api/tags
+
+    Answer length and text depend only on the prompt, timing on
+    --prefill-ms and --token-ms, and injected failures on --fail-rate and
+    --seed. Stops early when the client disconnects, like Ollama does.
+    """
+
+    def __init__(self, prefill_ms: float, token_ms: float, fail_rate: float, seed: int):
+        self.prefill = prefill_ms / 1000.0
+        self.token = token_ms / 1000.0
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"generations": 0, "tokens": 0, "failures": 0, "disconnects": 0}
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def count(self, key: str, amount: int = 1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def answer(self, prompt: str, limit: int):
+        seed = int(hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        length = rng.randint(40, 220)
+        tokens = [rng.choice(WORDS) + ("\n" if i % 12 == 11 else " ") for i in range(min(length, limit))]
+        return tokens, length > limit
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.0'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.write(b'{"models":[]}')
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+                with stub.lock:
+                    fail = stub.rng.random() < stub.fail_rate
+                if fail:
+                    stub.count("failures")
+                    self.send_response(500)
+                    self.end_headers()
+                    self.wfile.write(b'{"error":"stub failure"}')
+                    return
+                stub.count("generations")
+                tokens, truncated = stub.answer(body.get("prompt", ""), body.get("options", {}).get("num_predict", 256))
+                done = {"done": True, "eval_count": len(tokens), "done_reason": "length" if truncated else "stop"}
+                time.sleep(stub.prefill)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                if not body.get("stream"):
+                    time.sleep(stub.token * len(tokens))
+                    stub.count("tokens", len(tokens))
+                    self.wfile.write(json.dumps(dict(done, response="".join(tokens))).encode())
+                    return
+                try:
+                    for token in tokens:
+                        self.wfile.write(json.dumps({"response": token, "done": False}).encode() + b"\n")
+                        self.wfile.flush()
+                        stub.count("tokens")
+                        time.sleep(stub.token)
+                    self.wfile.write(json.dumps(done).encode() + b"\n")
+                except OSError:
+                    stub.count("disconnects")
+
+        return Handler
+
+
+def load_entries(patterns, limit):
+    entries = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            with open(path, encoding='utf-8') as f:
+                entries.extend(json.loads(line) for line in f if line.strip())
+    entries = [e for e in entries if e.get("mode") and (e.get("code") or e.get("code_hash"))]
+    entries.sort(key=lambda e: e.get("ts", 0))
+    return entries[:limit] if limit else entries
+
+
+def snippet_for(entry) -> str:
+    """The captured snippet, or a stable synthetic one of the same length for its hash"""
+    if entry.get("code"):
+        return entry["code"]
+    code_hash = entry["code_hash"]
+    header = f"# captured snippet {code_hash[:16]}\ndef handler(values):\n    return sorted(values)\n"
+    length = max(len(header), int(entry.get("code_length") or 0))
+    return (header + "#" * length)[:length]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def send(base_url, entry, timeout):
+    code, mode = snippet_for(entry), entry["mode"]
+    headers = {"X-API-Key": f"replay-{entry.get('client', 'anonymous')}"}
+    started = time.perf_counter()
+    result = {"endpoint": entry.get("endpoint", "explain"), "ttfb": None, "model": None}
+    try:
+        # WebSocket streams are replayed as SSE streams: same generation, same events
+        if result["endpoint"] in ("explain-stream", "ws"):
+            with requests.post(f"{base_url}/explain-stream", json={"code": code, "mode": mode},
+                               headers=headers, stream=True, timeout=timeout) as response:
+                result["status"] = response.status_code
+                for line in response.iter_lines():
+                    if not line.startswith(b"data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    if event.get("type") == "chunk" and result["ttfb"] is None:
+                        result["ttfb"] = time.perf_counter() - started
+                    elif event.get("type") == "done":
+                        result["model"] = event.get("model")
+                    elif event.get("type") == "error":
+                        result["status"] = 503
+        else:
+            response = requests.post(f"{base_url}/explain", json={"code": code, "mode": mode},
+                                     headers=headers, timeout=timeout)
+            result["status"] = response.status_code
+            if response.status_code == 200:
+                result["model"] = response.json().get("model")
+    except Exception as e:
+        result["status"] = f"error: {type(e).__name__}"
+    result["latency"] = time.perf_counter() - started
+    return result
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))] if ordered else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured explain traffic against a stub Ollama")
+    parser.add_argument('captures', nargs='+', help="Capture JSONL files or glob patterns")
+    parser.add_argument('--speed', type=float, default=1.0, help="Time scale (2 = twice as fast, 0 = no waiting)")
+    parser.add_argument('--concurrency', type=int, default=32, help="Maximum requests in flight")
+    parser.add_argument('--limit', type=int, default=0, help="Only replay the first N requests")
+    parser.add_argument('--prefill-ms', type=float, default=150.0)
+    parser.add_argument('--token-ms', type=float, default=15.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of stub generations that fail")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=300.0)
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help="Config override for the app under test (repeatable)")
+    parser.add_argument('--json', help="Also write the summary to this file")
+    args = parser.parse_args()
+
+    entries = load_entries(args.captures, args.limit)
+    if not entries:
+        print("❌ No replayable entries found")
+        return 1
+
+    stub = StubOllama(args.prefill_ms, args.token_ms, args.fail_rate, args.seed)
+    os.environ.update({
+        "OLLAMA_HOST": "127.0.0.1",
+        "OLLAMA_PORT": str(stub.port),
+        "FALLBACK_DELAY_SECONDS": "0",
+        "USE_FALLBACK_FIRST": "False",
+        "CAPTURE_ENABLED": "False",
+        "RATE_LIMIT_PER_MINUTE": "0",
+        "EXPLANATION_STORE_PATH": "",
+        # Captured clients keep their own scheduler share
+        "API_KEYS": ",".join(sorted({f"replay-{entry.get('client', 'anonymous')}" for entry in entries})),
+    })
+    for override in args.env:
+        key, _, value = override.partition('=')
+        os.environ[key] = value
+
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    port = free_port()
+    server = make_server('127.0.0.1', port, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{port}"
+    # One connection per request: the dev server does not keep connections alive
+    counters_before = requests.get(f"{base_url}/metrics").json()["counters"]
+
+    print(f"🔁 Replaying {len(entries)} requests at speed {args.speed:g} "
+          f"(stub: {args.prefill_ms:g} ms prefill, {args.token_ms:g} ms/token)")
+    first_ts = entries[0].get("ts", 0)
+    started = time.perf_counter()
+    lag = []
+    futures = []
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for entry in entries:
+            if args.speed > 0:
+                due = (entry.get("ts", first_ts) - first_ts) / args.speed
+                wait = due - (time.perf_counter() - started)
+                if wait > 0:
+                    time.sleep(wait)
+                lag.append(max(0.0, -wait))
+            futures.append(pool.submit(send, base_url, entry, args.timeout))
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+
+    counters = requests.get(f"{base_url}/metrics").json()["counters"]
+    delta = {k: counters.get(k, 0) - counters_before.get(k, 0) for k in set(counters) | set(counters_before)}
+    server.shutdown()
+
+    lookups = delta.get("cache_hits", 0) + delta.get("precomputed_hits", 0) + delta.get("cache_misses", 0)
+    ok = [r for r in results if r["status"] == 200]
+    summary = {
+        "requests": len(results),
+        "wall_seconds": round(wall, 2),
+        "status": {str(k): sum(1 for r in results if r["status"] == k) for k in {r["status"] for r in results}},
+        "cache_hit_rate": round((delta.get("cache_hits", 0) + delta.get("precomputed_hits", 0)) / lookups, 4) if lookups else 0.0,
+        "fallback_rate": round(sum(1 for r in ok if r["model"] == "smart-fallback") / len(ok), 4) if ok else 0.0,
+        "stub": stub.stats,
+        "max_schedule_lag_ms": round(max(lag) * 1000, 1) if lag else 0.0,
+        "endpoints": {},
+    }
+    for endpoint in sorted({r["endpoint"] for r in results}):
+        latencies = [r["latency"] * 1000 for r in results if r["endpoint"] == endpoint and r["status"] == 200]
+        ttfbs = [r["ttfb"] * 1000 for r in results if r["endpoint"] == endpoint and r["ttfb"] is not None]
+        summary["endpoints"][endpoint] = {
+            "count": len(latencies),
+            "p50_ms": round(percentile(latencies, 0.5), 1),
+            "p90_ms": round(percentile(latencies, 0.9), 1),
+            "p99_ms": round(percentile(latencies, 0.99), 1),
+            "max_ms": round(max(latencies), 1) if latencies else 0.0,
+            "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+            "ttfb_p50_ms": round(percentile(ttfbs, 0.5), 1) if ttfbs else None,
+        }
+
+    print("=" * 50)
+    for endpoint, stats in summary["endpoints"].items():
+        ttfb = f"   ttfb p50 {stats['ttfb_p50_ms']:.0f}" if stats["ttfb_p50_ms"] is not None else ""
+        print(f"   {endpoint:<15} n={stats['count']:<5} p50 {stats['p50_ms']:7.0f}  p90 {stats['p90_ms']:7.0f}  "
+              f"p99 {stats['p99_ms']:7.0f}  max {stats['max_ms']:7.0f} ms{ttfb}")
+    print(f"   status          {summary['status']}")
+    print(f"   cache hit rate  {summary['cache_hit_rate']:.1%}")
+    print(f"   fallback rate   {summary['fallback_rate']:.1%}")
+    print(f"   stub            {stub.stats}")
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,183 @@
 // Code Whisper Frontend JavaScript
+
+// Incremental renderer for streamed explanations.
+// Deltas are buffered and applied once per animation frame. Each completed
+// line is rendered once and appended to the open paragraph, list or code
+// block (or starts a new one); nothing already rendered is rebuilt. Only
+// the line still being streamed is shown as a single text node whose text
+// is replaced, so work per frame stays small no matter how long the
+// explanation grows.
+class StreamRenderer {
+    constructor(container) {
+        this.container = container;
+        this.pending = '';
+        this.partial = '';
+        this.received = false;
+        this.frame = null;
+        // Element that following lines extend: a paragraph, list or code block
+        this.block = null;
+        this.blockKind = null;
+        
+        this.container.textContent = '';
+        this.tail = document.createTextNode('');
+        this.cursor = document.createElement('span');
+        this.cursor.className = 'streaming-cursor';
+        this.cursor.textContent = '▋';
+        this.container.appendChild(this.cursor);
+    }
+
+    append(delta) {
+        if (!delta) return;
+        this.received = true;
+        this.pending += delta;
+        if (this.frame === null) {
+            this.frame = requestAnimationFrame(() => this.flush());
+        }
+    }
+
+    flush() {
+        this.frame = null;
+        if (!this.pending) return;
+        
+        const lines = (this.partial + this.pending).split('\n');
+        this.pending = '';
+        this.partial = lines.pop();
+        if (lines.length) {
+            this.tail.remove();
+            for (const line of lines) {
+                this.addLine(line);
+            }
+        }
+        this.showPartial();
+        
+        // Auto-scroll to bottom
+        this.container.scrollTop = this.container.scrollHeight;
+    }
+
+    cancel() {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        this.pending = '';
+    }
+
+    finish(finalText = null) {
+        if (this.frame !== null) {
+            cancelAnimationFrame(this.frame);
+            this.frame = null;
+        }
+        // Fall back to the server's full text if no chunks were rendered
+        if (finalText && !this.received) {
+            this.pending = finalText;
+        }
+        this.flush();
+        this.tail.remove();
+        if (this.partial) {
+            this.addLine(this.partial);
+            this.partial = '';
+        }
+        this.cursor.remove();
+    }
+
+    // Render one completed line into the open block, or start a new block
+    addLine(line) {
+        const fence = /^\s*```/.test(line);
+        if (this.blockKind === 'code') {
+            if (fence) {
+                this.closeBlock();
+            } else {
+                this.block.appendChild(document.createTextNode(line + '\n'));
+            }
+            return;
+        }
+        if (fence) {
+            const pre = document.createElement('pre');
+            this.openBlock('code', pre.appendChild(document.createElement('code')), pre);
+            return;
+        }
+        if (!line.trim()) {
+            this.closeBlock();
+            return;
+        }
+        
+        const heading = /^(#{1,6})\s+(.*)$/.exec(line);
+        if (heading) {
+            const h = document.createElement('h4');
+            StreamRenderer.renderInline(h, heading[2]);
+            this.container.insertBefore(h, this.cursor);
+            this.closeBlock();
+            return;
+        }
+        
+        const bullet = /^\s*(?:[-*•]|\d+[.)])\s+/;
+        if (bullet.test(line)) {
+            const kind = /^\s*\d/.test(line) ? 'ol' : 'ul';
+            if (this.blockKind !== kind) {
+                const list = document.createElement(kind);
+                this.openBlock(kind, list, list);
+            }
+            const item = document.createElement('li');
+            StreamRenderer.renderInline(item, line.replace(bullet, ''));
+            this.block.appendChild(item);
+            return;
+        }
+        
+        if (this.blockKind !== 'p') {
+            const paragraph = document.createElement('p');
+            this.openBlock('p', paragraph, paragraph);
+        } else {
+            this.block.appendChild(document.createTextNode('\n'));
+        }
+        StreamRenderer.renderInline(this.block, line);
+    }
+
+    openBlock(kind, block, element) {
+        this.container.insertBefore(element, this.cursor);
+        this.block = block;
+        this.blockKind = kind;
+    }
+
+    closeBlock() {
+        this.block = null;
+        this.blockKind = null;
+    }
+
+    // The unfinished line goes where it will end up (paragraph or code block), as plain text
+    showPartial() {
+        const inBlock = this.blockKind === 'p' || this.blockKind === 'code';
+        const text = this.partial && this.blockKind === 'p' ? '\n' + this.partial : this.partial;
+        if (this.tail.data !== text) {
+            this.tail.data = text;
+        }
+        if (!this.tail.parentNode) {
+            if (inBlock) {
+                this.block.appendChild(this.tail);
+            } else {
+                this.container.insertBefore(this.tail, this.cursor);
+            }
+        }
+    }
+
+    static renderInline(parent, text) {
+        // **bold** and `code` spans; everything else is plain text
+        for (const part of text.split(/(\*\*[^*]+\*\*|`[^`]+`)/)) {
+            if (!part) continue;
+            if (part.startsWith('**') && part.endsWith('**') && part.length > 4) {
+                const strong = document.createElement('strong');
+                strong.textContent = part.slice(2, -2);
+                parent.appendChild(strong);
+            } else if (part.startsWith('`') && part.endsWith('`') && part.length > 2) {
+                const code = document.createElement('code');
+                code.textContent = part.slice(1, -1);
+                parent.appendChild(code);
+            } else {
+                parent.appendChild(document.createTextNode(part));
+            }
+        }
+    }
+}
+
 class CodeWhisper {
     constructor() {
         this.apiUrl = 'http://localhost:5000';
@@ -6,6 +185,22 @@ class CodeWhisper {
         this.currentSpeech = null;
         this.currentTheme = 'light';
         
+        // Multiplexed WebSocket streams (falls back to /explain-stream if unavailable)
+        this.socket = null;
+        this.socketPromise = null;
+        this.socketUnavailable = false;
+        this.socketStreams = new Map();
+        this.activeStreamId = null;
+        this.streamCounter = 0;
+        this.streamRenderer = null;
+        
+        // X-Request-ID of the HTTP explanation in flight, so it can be cancelled server-side
+        this.activeRequestId = null;
+        
+        // Recent /explain answers by mode and code, revalidated with their ETag
+        this.explanations = new Map();
+        this.maxExplanations = 20;
+        
         this.initializeElements();
         this.initializeTheme();
         this.bindEvents();
@@ -126,6 +321,11 @@ class CodeWhisper {
         });
         
         this.explainBtn.addEventListener('click', () => this.explainCode());
+        // Leaving the page: stop the generation nobody will read
+        window.addEventListener('pagehide', () => {
+            this.cancelActiveStream();
+            this.cancelActiveRequest();
+        });
         this.codeInput.addEventListener('keydown', (e) => {
             // Ctrl+Enter to explain
             if ((e.ctrlKey || e.metaKey) && e.key === 'Enter') {
@@ -209,16 +409,51 @@ class CodeWhisper {
         
         try {
             // Prefer streaming for responsiveness on slower hardware
-            await this.explainCodeStream(code, mode, startTime);
+            let socket = null;
+            try {
+                socket = await this.connectSocket();
+            } catch (error) {
+                console.warn('WebSocket unavailable, using HTTP streaming:', error);
+            }
+            if (socket) {
+                await this.explainCodeSocket(code, mode, startTime);
+            } else if (this.canStreamFetch()) {
+                await this.explainCodeStream(code, mode, startTime);
+            } else {
+                // Plain requests revalidate answers seen before by ETag
+                await this.explainCodeRegular(code, mode, startTime);
+            }
         } catch (error) {
             console.error('Request failed:', error);
             this.showErrorState(error.message);
             this.showNotification(`Failed to explain code: ${error.message}`, 'error');
         } finally {
+            this.activeRequestId = null;
             this.explainBtn.disabled = false;
         }
     }
 
+    canStreamFetch() {
+        return typeof ReadableStream !== 'undefined' && typeof TextDecoder !== 'undefined'
+            && typeof Response !== 'undefined' && 'body' in Response.prototype;
+    }
+
+    newRequestId() {
+        const id = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+        this.activeRequestId = id;
+        return id;
+    }
+
+    cancelActiveRequest() {
+        const id = this.activeRequestId;
+        if (!id) return;
+        this.activeRequestId = null;
+        // keepalive lets the request outlive a page that is being unloaded
+        fetch(`${this.apiUrl}/explain/${id}`, { method: 'DELETE', keepalive: true }).catch(() => {});
+    }
+
     async explainCodeStream(code, mode, startTime) {
         return new Promise((resolve, reject) => {
             // Use fetch with ReadableStream for streaming
@@ -226,6 +461,7 @@ class CodeWhisper {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'X-Request-ID': this.newRequestId(),
                 },
                 body: JSON.stringify({
                     code: code,
@@ -240,14 +476,12 @@ class CodeWhisper {
                 const reader = response.body.getReader();
                 const decoder = new TextDecoder();
                 let buffer = '';
-                let fullExplanation = '';
-                let isComplete = false;
-                let streamContext = { mode: null, model: null };
+                const state = this.createStreamState(startTime, resolve, reject);
                 
                 const readStream = () => {
                     reader.read().then(({ done, value }) => {
                         if (done) {
-                            if (!isComplete) {
+                            if (!state.isComplete) {
                                 reject(new Error('Stream ended unexpectedly'));
                             }
                             return;
@@ -261,43 +495,8 @@ class CodeWhisper {
                             if (line.startsWith('data: ')) {
                                 try {
                                     const data = JSON.parse(line.slice(6));
-                                    
-                                    switch (data.type) {
-                                        case 'start':
-                                            streamContext.mode = data.mode;
-                                            streamContext.model = data.model;
-                                            this.showStreamingExplanation(data);
-                                            break;
-                                            
-                                        case 'chunk':
-                                            fullExplanation = data.accumulated;
-                                            this.updateStreamingText(data.content, fullExplanation);
-                                            break;
-                                            
-                                        case 'done':
-                                            {
-                                                const duration = Date.now() - startTime;
-                                                this.completeStreaming(data, duration);
-                                                isComplete = true;
-                                                resolve();
-                                                return;
-                                            }
-                                        case 'complete':
-                                            {
-                                                // Backend sent a final 'complete' event without full_text
-                                                const duration = Date.now() - startTime;
-                                                this.completeStreaming({
-                                                    full_text: fullExplanation,
-                                                    mode: streamContext.mode,
-                                                    model: streamContext.model
-                                                }, duration);
-                                                isComplete = true;
-                                                resolve();
-                                                return;
-                                            }
-                                        case 'error':
-                                            reject(new Error(data.message));
-                                            return;
+                                    if (this.handleStreamEvent(data, state)) {
+                                        return;
                                     }
                                 } catch (error) {
                                     console.warn('Failed to parse streaming data:', line);
@@ -315,12 +514,156 @@ class CodeWhisper {
         });
     }
 
+    createStreamState(startTime, resolve, reject) {
+        return {
+            startTime,
+            resolve,
+            reject,
+            fullExplanation: '',
+            isComplete: false,
+            mode: null,
+            model: null
+        };
+    }
+
+    // Apply one stream event; returns true once the stream has finished
+    handleStreamEvent(data, state) {
+        switch (data.type) {
+            case 'start':
+                state.mode = data.mode;
+                state.model = data.model;
+                this.showStreamingExplanation(data);
+                return false;
+                
+            case 'chunk':
+                state.fullExplanation += data.content;
+                this.updateStreamingText(data.content);
+                return false;
+                
+            case 'done':
+                this.completeStreaming(data, Date.now() - state.startTime);
+                state.isComplete = true;
+                state.resolve();
+                return true;
+                
+            case 'complete':
+                // Backend sent a final 'complete' event without full_text
+                if (!state.isComplete) {
+                    this.completeStreaming({
+                        full_text: state.fullExplanation,
+                        mode: state.mode,
+                        model: state.model
+                    }, Date.now() - state.startTime);
+                    state.isComplete = true;
+                    state.resolve();
+                }
+                return true;
+                
+            case 'cancelled':
+                state.isComplete = true;
+                if (data.reason === 'deadline') {
+                    state.reject(new Error('The explanation took too long and was stopped.'));
+                } else {
+                    state.resolve();
+                }
+                return true;
+                
+            case 'error':
+                state.reject(new Error(data.message));
+                return true;
+        }
+        return false;
+    }
+
+    connectSocket() {
+        if (this.socketUnavailable || !('WebSocket' in window)) {
+            return Promise.reject(new Error('WebSocket not supported'));
+        }
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            return Promise.resolve(this.socket);
+        }
+        if (this.socketPromise) {
+            return this.socketPromise;
+        }
+        
+        this.socketPromise = new Promise((resolve, reject) => {
+            const socket = new WebSocket(`${this.apiUrl.replace(/^http/, 'ws')}/ws`);
+            
+            socket.onopen = () => {
+                this.socket = socket;
+                this.socketPromise = null;
+                resolve(socket);
+            };
+            
+            socket.onmessage = (event) => {
+                let data;
+                try {
+                    data = JSON.parse(event.data);
+                } catch (error) {
+                    console.warn('Failed to parse socket message:', event.data);
+                    return;
+                }
+                const state = this.socketStreams.get(data.id);
+                if (state && this.handleStreamEvent(data, state)) {
+                    this.socketStreams.delete(data.id);
+                }
+            };
+            
+            socket.onerror = () => {
+                if (this.socketPromise) {
+                    // Never connected: the server has no WebSocket support
+                    this.socketUnavailable = true;
+                    this.socketPromise = null;
+                    reject(new Error('WebSocket connection failed'));
+                }
+            };
+            
+            socket.onclose = () => {
+                this.socket = null;
+                for (const state of this.socketStreams.values()) {
+                    state.reject(new Error('Connection closed'));
+                }
+                this.socketStreams.clear();
+            };
+        });
+        return this.socketPromise;
+    }
+
+    explainCodeSocket(code, mode, startTime) {
+        return new Promise((resolve, reject) => {
+            // Only one explanation is shown at a time; stop generating the previous one
+            this.cancelActiveStream();
+            
+            const id = `s${++this.streamCounter}`;
+            this.activeStreamId = id;
+            this.socketStreams.set(id, this.createStreamState(startTime, resolve, reject));
+            this.socket.send(JSON.stringify({ type: 'explain', id, code, mode }));
+        });
+    }
+
+    cancelActiveStream() {
+        const id = this.activeStreamId;
+        if (!id || !this.socketStreams.has(id)) return;
+        
+        this.socketStreams.get(id).resolve();
+        this.socketStreams.delete(id);
+        if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+            this.socket.send(JSON.stringify({ type: 'cancel', id }));
+        }
+    }
+
     async explainCodeRegular(code, mode, startTime) {
+        const key = `${mode}\n${code}`;
+        const known = this.explanations.get(key);
+        const headers = {
+            'Content-Type': 'application/json',
+            'X-Request-ID': this.newRequestId(),
+        };
+        if (known) headers['If-None-Match'] = known.etag;
+        
         const response = await fetch(`${this.apiUrl}/explain`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
+            headers,
             body: JSON.stringify({
                 code: code,
                 mode: mode
@@ -329,6 +672,12 @@ class CodeWhisper {
         
         const duration = Date.now() - startTime;
         
+        if (response.status === 304 && known) {
+            this.showExplanation(known.data, duration);
+            this.showNotification('Code explained successfully (cached)!', 'success');
+            return;
+        }
+        
         if (!response.ok) {
             // Try parse JSON error, otherwise show status text
             let message = `HTTP ${response.status}: ${response.statusText}`;
@@ -340,11 +689,21 @@ class CodeWhisper {
         }
         
         const data = await response.json();
+        this.rememberExplanation(key, response.headers.get('ETag'), data);
         this.showExplanation(data, duration);
         const model = data.model ? ` (model: ${data.model})` : '';
         this.showNotification(`Code explained successfully${model}!`, 'success');
     }
 
+    rememberExplanation(key, etag, data) {
+        this.explanations.delete(key);
+        if (!etag) return;  // fallback answers are not kept
+        this.explanations.set(key, { etag, data });
+        if (this.explanations.size > this.maxExplanations) {
+            this.explanations.delete(this.explanations.keys().next().value);
+        }
+    }
+
     showStreamingExplanation(data) {
         this.hideAllStates();
         
@@ -363,23 +722,31 @@ class CodeWhisper {
         
         // Show explanation content
         this.explanationContent.style.display = 'block';
-        this.explanationText.innerHTML = '<span class="streaming-cursor">▋</span>';
+        this.explanationText.classList.add('markdown');
+        if (this.streamRenderer) {
+            this.streamRenderer.cancel();
+        }
+        this.streamRenderer = new StreamRenderer(this.explanationText);
         
         // Update speak button state
         this.updateSpeakButton();
     }
 
-    updateStreamingText(chunk, fullText) {
-        // Remove cursor and add new content with cursor at the end
-        this.explanationText.innerHTML = fullText + '<span class="streaming-cursor">▋</span>';
-        
-        // Auto-scroll to bottom
-        this.explanationText.scrollTop = this.explanationText.scrollHeight;
+    updateStreamingText(chunk) {
+        // Only the new delta is handed over; the renderer batches DOM work per frame
+        if (this.streamRenderer) {
+            this.streamRenderer.append(chunk);
+        }
     }
 
     completeStreaming(data, duration) {
-        // Remove cursor and show final text
-        this.explanationText.innerHTML = data.full_text;
+        // Render what is left and remove the cursor
+        if (this.streamRenderer) {
+            this.streamRenderer.finish(data.full_text);
+            this.streamRenderer = null;
+        } else {
+            this.explanationText.textContent = data.full_text || '';
+        }
         
         // Update meta with final info
         const modeNames = {
@@ -460,6 +827,7 @@ class CodeWhisper {
     startTypingEffect(text) {
         // Clear any existing content
         this.explanationText.innerHTML = '';
+        this.explanationText.classList.remove('markdown');
         
         // Split text into lines for better typing effect
         const lines = text.split('\n');
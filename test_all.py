@@ -6,6 +6,7 @@ Tests the reorganized backend without depending on Ollama
 
 import sys
 import os
+import time
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -83,6 +84,322 @@ def test_folder_structure():
         print("✅ Folder structure is correct")
         return True
 
+def test_fair_scheduler():
+    """Test deficit round-robin order and withdrawal on timeout or cancel"""
+    print("\n⚖️  Testing fair scheduler...")
+    
+    try:
+        import threading
+        from backend.services.cancellation import CancelToken, Cancelled
+        from backend.services.scheduler import FairScheduler, SchedulerTimeout
+        
+        scheduler = FairScheduler(slots=1)
+        order = []
+        release_holder = threading.Event()
+        
+        def hold():
+            with scheduler.slot("holder"):
+                release_holder.wait(5)
+        
+        def request(client_id):
+            with scheduler.slot(client_id, timeout=5):
+                order.append(client_id)
+        
+        holder = threading.Thread(target=hold)
+        holder.start()
+        while scheduler.stats()["busy"] != 1:
+            time.sleep(0.001)
+        
+        # "a" bursts three requests before "b" and "c" queue one each
+        threads = []
+        for client_id in ["a", "a", "a", "b", "c"]:
+            thread = threading.Thread(target=request, args=(client_id,))
+            thread.start()
+            threads.append(thread)
+            while scheduler.stats()["waiting"] != len(threads):
+                time.sleep(0.001)
+        
+        # With the slot still held, timed out and cancelled waiters leave the queue
+        try:
+            with scheduler.slot("d", timeout=0.05):
+                raise AssertionError("slot granted while busy")
+        except SchedulerTimeout:
+            pass
+        token = CancelToken()
+        threading.Timer(0.05, token.cancel).start()
+        try:
+            with scheduler.slot("e", timeout=5, cancel=token):
+                raise AssertionError("slot granted while busy")
+        except Cancelled:
+            pass
+        assert scheduler.stats()["waiting"] == 5, scheduler.stats()
+        assert scheduler.stats()["waiting_clients"] == 3, scheduler.stats()
+        
+        release_holder.set()
+        holder.join(5)
+        for thread in threads:
+            thread.join(5)
+        assert order == ["a", "b", "c", "a", "a"], order
+        assert scheduler.stats() == {"slots": 1, "busy": 0, "waiting": 0, "waiting_clients": 0}
+        
+        print("✅ Fair scheduler works")
+        return True
+    except Exception as e:
+        print(f"❌ Fair scheduler test failed: {e}")
+        return False
+
+def test_token_bucket():
+    """Test token bucket refill and retry-after with explicit clock values"""
+    print("\n🪣 Testing token bucket...")
+    
+    try:
+        from backend.services.rate_limiter import InMemoryBucketBackend
+        
+        start = time.monotonic()
+        backend = InMemoryBucketBackend(sweep_interval=60)
+        # 1 token per second, burst of 2
+        assert backend.take("client", 1.0, 2, now=start) == (True, 0.0)
+        assert backend.take("client", 1.0, 2, now=start) == (True, 0.0)
+        allowed, retry_after = backend.take("client", 1.0, 2, now=start)
+        assert not allowed and abs(retry_after - 1.0) < 1e-9, retry_after
+        allowed, retry_after = backend.take("client", 1.0, 2, now=start + 0.5)
+        assert not allowed and abs(retry_after - 0.5) < 1e-9, retry_after
+        assert backend.take("client", 1.0, 2, now=start + 1.0) == (True, 0.0)
+        
+        # Buckets that have refilled are forgotten at the next sweep
+        assert backend.take("other", 1.0, 2, now=start + 1.0) == (True, 0.0)
+        assert len(backend) == 2
+        backend.take("other", 1.0, 2, now=start + 61)
+        assert len(backend) == 1
+        
+        print("✅ Token bucket works")
+        return True
+    except Exception as e:
+        print(f"❌ Token bucket test failed: {e}")
+        return False
+
+def test_structure_tracker():
+    """Test where streamed answers are stopped early"""
+    print("\n✂️  Testing structure tracker...")
+    
+    try:
+        from backend.services.generation_budget import StructureTracker
+        
+        # An unrequested section after all requested ones is cut at its heading
+        answer = "Issues: none\nRisks: low\nRefactor Suggestions:\n- rename x\nConclusion:\nMore text\n"
+        tracker = StructureTracker("review")
+        stops = [tracker.feed(answer[i:i + 5]) for i in range(0, len(answer), 5)]
+        assert stops[-1] and tracker.stop_reason == "extra_section", tracker.stop_reason
+        assert answer[:tracker.end] == "Issues: none\nRisks: low\nRefactor Suggestions:\n- rename x\n"
+        
+        # Friend answers stop at the bullet allowance, keeping the last bullet
+        bullets = "".join(f"- point {n}\n" for n in range(12))
+        tracker = StructureTracker("friend")
+        assert tracker.feed(bullets) and tracker.stop_reason == "bullet_limit"
+        assert bullets[:tracker.end].count("\n") == 9
+        
+        # Lines shaped like "Word:" are content, not sections: examples and code survive
+        answer = ("Issues: none\nRisks: low\nRefactor Suggestions:\n- Extract a helper.\nExample:\n"
+                  "```python\n# Summary\ndef helper():\n    return 1\n```\n")
+        tracker = StructureTracker("review")
+        assert not tracker.feed(answer), tracker.stop_reason
+        answer = ("Purpose: sums a list\nFlow: loops once\nKey Concepts: iteration\nComplexity: O(n)\n"
+                  "Edge Cases:\nFor example:\n- an empty list\n")
+        tracker = StructureTracker("professor")
+        assert not tracker.feed(answer), tracker.stop_reason
+        
+        # Incomplete lines are never judged; modes without structure never stop
+        tracker = StructureTracker("review")
+        assert not tracker.feed("Issues: none\nRisks: low\nRefactor Suggestions:\n- a\nConclusion:")
+        assert tracker.holding
+        assert not StructureTracker("babysitter").feed(bullets)
+        
+        print("✅ Structure tracker works")
+        return True
+    except Exception as e:
+        print(f"❌ Structure tracker test failed: {e}")
+        return False
+
+def test_request_deadlines():
+    """Test deadline cancellation and per-client request ids"""
+    print("\n⏱️  Testing request deadlines...")
+    
+    try:
+        from backend.services.cancellation import ActiveRequests
+        
+        requests = ActiveRequests()
+        expiring = requests.track("req", "ip:a", deadline=0.05)
+        # Request ids are per client: the same id from another client is a different request
+        other = requests.track("req", "ip:b", deadline=30)
+        assert len(requests) == 2
+        assert expiring.wait(2), "deadline did not fire"
+        assert expiring.reason == "deadline"
+        assert not other.cancelled
+        
+        # Released requests are neither cancelled by their deadline nor by id
+        closed = []
+        finished = requests.track("done", "ip:a", deadline=0.05)
+        finished.on_cancel(lambda: closed.append("done"))
+        requests.release("done", "ip:a", finished)
+        time.sleep(0.1)
+        assert not finished.cancelled
+        assert not requests.cancel("done", "ip:a")
+        # ...and whatever they registered to close is not kept or run
+        finished.cancel()
+        assert not closed, closed
+        
+        # Only the owning client can cancel; a cleared deadline no longer applies
+        assert not requests.cancel("req", "ip:c")
+        other.clear_deadline()
+        assert requests.cancel("req", "ip:b") and other.reason == "client"
+        
+        print("✅ Request deadlines work")
+        return True
+    except Exception as e:
+        print(f"❌ Request deadline test failed: {e}")
+        return False
+
+def test_shared_cache_eviction():
+    """Test expiry and LRU eviction of the shared cache, and the bucket sweep"""
+    print("\n🗄️  Testing shared cache eviction...")
+    
+    try:
+        import tempfile
+        from backend.services.shared_state import SharedStateStore
+        
+        with tempfile.TemporaryDirectory() as directory:
+            store = SharedStateStore(os.path.join(directory, "shared.db"), cache_max_entries=2)
+            store.cache_put("expired", "old", ttl=-1)
+            assert store.cache_get("expired") is None
+            for key in ["a", "b", "c"]:
+                store.cache_put(key, key.upper(), ttl=60)
+                time.sleep(0.01)  # distinct access times
+            assert store.cache_get("a") is None
+            assert store.cache_get("b") == "B" and store.cache_get("c") == "C"
+            assert store.cache_size() == 2, store.cache_size()
+            
+            # Rate-limit buckets that have refilled are deleted at the next sweep
+            start = time.time()
+            store = SharedStateStore(os.path.join(directory, "buckets.db"), bucket_sweep_interval=60)
+            # 1 token per 20 seconds, burst of 2
+            assert store.take("ip:a", 0.05, 2, now=start) == (True, 0.0)
+            assert store.take("ip:b", 0.05, 2, now=start + 50) == (True, 0.0)
+            assert store.bucket_count() == 2
+            store.take("ip:c", 0.05, 2, now=start + 61)
+            assert store.bucket_count() == 2, store.bucket_count()  # "ip:a" refilled, "ip:b" has not
+            store.take("ip:c", 0.05, 2, now=start + 200)
+            assert store.bucket_count() == 1, store.bucket_count()
+        
+        print("✅ Shared cache eviction works")
+        return True
+    except Exception as e:
+        print(f"❌ Shared cache eviction test failed: {e}")
+        return False
+
+def test_explain_ingestion():
+    """Test JSON, text/plain and multipart explain requests without calling Ollama"""
+    print("\n📥 Testing explain request parsing...")
+    
+    try:
+        import io
+        import app
+        from backend.config import Config
+        
+        client = app.app.test_client()
+        code = "def add(a, b):\n    return a + b"
+        
+        # Oversized bodies are refused from Content-Length before anything is read
+        response = client.post("/explain", data=b"x" * (Config.MAX_REQUEST_BYTES + 1),
+                               content_type="application/json")
+        assert response.status_code == 413, response.status_code
+        
+        response = client.post("/explain", data=b"{not json", content_type="application/json")
+        assert response.status_code == 400 and response.get_json()["error"] == "Invalid JSON body"
+        
+        for response in [
+            client.post("/explain", json={"code": code}),
+            client.post("/explain", data=code, content_type="text/plain"),
+        ]:
+            assert response.status_code == 400, response.status_code
+            assert response.get_json()["error"] == "Missing required fields: 'code' and 'mode'"
+        
+        # Parsed snippets are answered by their ETag before any generation, so a 304
+        # shows the code and mode arrived intact
+        etag = f'W/"{app.explanation_etag(code, "review")}"'
+        response = client.post("/explain?mode=review", data=code.encode("utf-8"),
+                               content_type="text/plain; charset=utf-8", headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.status_code
+        response = client.post("/explain", data={"mode": "review", "code": (io.BytesIO(code.encode("utf-8")), "add.py")},
+                               content_type="multipart/form-data", headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.status_code
+        
+        print("✅ Explain request parsing works")
+        return True
+    except Exception as e:
+        print(f"❌ Explain request parsing test failed: {e}")
+        return False
+
+def test_etags_and_compression():
+    """Test ETag revalidation and response compression without calling Ollama"""
+    print("\n🏷️  Testing ETags and compression...")
+    
+    service = None
+    try:
+        import gzip
+        import app
+        from backend.config import Config
+        
+        client = app.app.test_client()
+        
+        # /modes is built once with a strong ETag
+        response = client.get("/modes")
+        etag = response.headers.get("ETag")
+        assert response.status_code == 200 and etag and not etag.startswith("W/"), etag
+        assert client.get("/modes", headers={"If-None-Match": etag}).status_code == 304
+        
+        # Stand in for the model so /explain answers offline
+        service = app.ollama_deferred.get()
+        answer = {"success": True, "model": "test-model"}
+        service.is_available = lambda: True
+        service.lookup_cached = lambda code, mode: None
+        service.get_explanation = lambda code, mode, **kwargs: dict(answer, mode=mode)
+        
+        code = "print('etag')"
+        answer["explanation"] = "x" * Config.COMPRESS_MIN_BYTES
+        response = client.post("/explain", json={"code": code, "mode": "friend"},
+                               headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200, response.status_code
+        assert response.headers.get("Content-Encoding") == "gzip"
+        assert "Accept-Encoding" in response.headers.get("Vary", "")
+        assert b'"model":"test-model"' in gzip.decompress(response.get_data()).replace(b" ", b"")
+        etag = response.headers.get("ETag")
+        assert etag and etag.startswith("W/"), etag
+        
+        # A client holding the answer gets a 304 before anything is generated
+        response = client.post("/explain", json={"code": code, "mode": "friend"}, headers={"If-None-Match": etag})
+        assert response.status_code == 304, response.status_code
+        
+        # Small bodies are sent as is
+        answer["explanation"] = "short"
+        response = client.post("/explain", json={"code": code, "mode": "friend"},
+                               headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200 and "Content-Encoding" not in response.headers
+        
+        # Fallback answers are never validators
+        answer["model"] = "smart-fallback"
+        response = client.post("/explain", json={"code": code, "mode": "friend"})
+        assert response.status_code == 200 and "ETag" not in response.headers
+        
+        print("✅ ETags and compression work")
+        return True
+    except Exception as e:
+        print(f"❌ ETag and compression test failed: {e}")
+        return False
+    finally:
+        if service is not None:
+            for name in ("is_available", "lookup_cached", "get_explanation"):
+                service.__dict__.pop(name, None)
+
 def main():
     """Run all tests"""
     print("🚀 Code Whisper - Post-Reorganization Tests")
@@ -91,7 +408,14 @@ def main():
     tests = [
         test_folder_structure,
         test_imports,
-        test_config
+        test_config,
+        test_fair_scheduler,
+        test_token_bucket,
+        test_structure_tracker,
+        test_request_deadlines,
+        test_shared_cache_eviction,
+        test_explain_ingestion,
+        test_etags_and_compression
     ]
     
     passed = 0
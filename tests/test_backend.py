@@ -36,6 +36,20 @@ def test_modes_endpoint():
     except Exception as e:
         print(f"❌ Modes endpoint error: {e}")
 
+def test_usage_endpoint():
+    """Test the per-client usage endpoint"""
+    print("\n🔍 Testing usage endpoint...")
+    try:
+        response = requests.get(f"{BASE_URL}/usage", headers={"X-API-Key": "test-suite"})
+        if response.status_code == 200:
+            print("✅ Usage endpoint passed")
+            data = response.json()
+            print(f"   Client: {data['client']}, scheduler: {data['scheduler']}")
+        else:
+            print(f"❌ Usage endpoint failed: {response.status_code}")
+    except Exception as e:
+        print(f"❌ Usage endpoint error: {e}")
+
 def test_explain_endpoint():
     """Test the explain endpoint with sample code"""
     print("\n🔍 Testing explain endpoint...")
@@ -116,6 +130,7 @@ if __name__ == "__main__":
     
     test_health_check()
     test_modes_endpoint()
+    test_usage_endpoint()
     test_explain_endpoint()
     test_error_cases()
     